@@ -0,0 +1,125 @@
+import argparse, json, os, platform, statistics, sys, tempfile, time
+import numpy as np
+import PIL
+
+import starsave
+from starspawn import SPBoard, get_atlas, render_modes
+from bench import savegen
+
+## Timing
+
+def timed(stage, repeat, setup, run):
+    # best and median of fresh runs; setup is untimed and hands run its input
+    runs = []
+    for _ in range(repeat):
+        state = setup()
+        start = time.perf_counter()
+        run(state)
+        runs.append(time.perf_counter() - start)
+    return dict(stage=stage, min=min(runs), median=statistics.median(runs), runs=runs)
+
+def new_board(save, size, border, radius):
+    board = SPBoard(size, border=border, visible=radius)
+    save.tiles.fill(board)
+    return board
+
+def seen_board(save, size, border, radius):
+    board = new_board(save, size, border, radius)
+    board.prepare()
+    return board
+
+def rendered_board(save, size, border, radius):
+    board = seen_board(save, size, border, radius)
+    board.render()
+    return board
+
+def bench_case(path, size, radius, border, repeat):
+    # every stage from parsing the save to shifting the finished images
+    save = starsave.load(path)
+    results = [timed("parse", repeat, lambda: path, starsave.load)]
+    results.append(timed("place", repeat, lambda: SPBoard(size, border=border, visible=radius), save.tiles.fill))
+    results.append(timed("mark_unseen", repeat, lambda: new_board(save, size, border, radius), lambda board: board.mark_unseen(radius)))
+    results.append(timed("find_offset", repeat, lambda: seen_board(save, size, border, radius), lambda board: board.find_offset()))
+    for mode in render_modes:
+        results.append(timed("render." + mode, repeat, lambda: seen_board(save, size, border, radius), lambda board: board.render([mode])))
+    results.append(timed("shift", repeat, lambda: rendered_board(save, size, border, radius), lambda board: board.shift(size // 3, size // 5)))
+    for result in results:
+        result.update(size=size, radius=radius, border=border, tiles=len(save.tiles))
+    return results
+
+def run(sizes, radii, border=False, repeat=5, knobs={}):
+    # islands and user blocks keep their density per 160x160 as the board grows
+    get_atlas()
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        for size in sizes:
+            area = (size / 160) ** 2
+            case = dict(knobs, size=size, islands=round(knobs.get("islands", 40) * area))
+            path = os.path.join(folder, "bench-%d.save" % size)
+            savegen.write(path, **case)
+            for radius in radii:
+                results += bench_case(path, size, radius, border, repeat)
+    return results
+
+def environment():
+    return dict(python=platform.python_version(), numpy=np.__version__, pillow=PIL.__version__,
+                machine=platform.machine(), system=platform.system(), cpus=os.cpu_count(),
+                time=time.strftime("%Y-%m-%dT%H:%M:%S"))
+
+## Comparison
+
+def case_key(result):
+    return result["stage"], result["size"], result["radius"], result["border"]
+
+def compare(baseline, current, threshold):
+    # stages whose best time grew by more than the threshold, as (key, before, after)
+    before = {case_key(result): result["min"] for result in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        key = case_key(result)
+        if key in before:
+            ratio = result["min"] / before[key] if before[key] else 1
+            print("%-18s size %4d radius %3d %s %9.4fs -> %9.4fs  x%.2f" % (key[0], key[1], key[2], "border" if key[3] else "      ", before[key], result["min"], ratio))
+            if ratio > threshold:
+                regressions.append((key, before[key], result["min"]))
+    return regressions
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="Time every Starspawn stage on synthetic saves")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[80, 160], help="board sizes in tiles (default 80 160)")
+    parser.add_argument("--radii", nargs="+", type=int, default=[5, 10], help="island hide radii (default 5 10)")
+    parser.add_argument("-b", "--border", action="store_true", help="time 2x tile mode")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per stage (default 5)")
+    parser.add_argument("--output", metavar="PATH", help="write results as JSON to PATH")
+    parser.add_argument("--compare", metavar="BASELINE", help="compare against an earlier JSON result, failing on regressions")
+    parser.add_argument("--threshold", type=float, default=1.1, help="slowdown ratio counted as a regression (default 1.1)")
+
+    group_save = parser.add_argument_group("synthetic save")
+    group_save.add_argument("--islands", type=int, default=40, help="rock islands per 160x160 of board (default 40)")
+    group_save.add_argument("--island-size", type=int, default=30, help="mean rock tiles per island (default 30)")
+    group_save.add_argument("--gateways", type=int, default=1, help="gateways per island (default 1)")
+    group_save.add_argument("--density", type=float, default=0.02, help="user blocks as a fraction of the board (default 0.02)")
+    group_save.add_argument("--layout", choices=savegen.layouts, default="clustered", help="how user blocks are spread (default clustered)")
+    group_save.add_argument("--seed", type=int, default=0, help="random seed (default 0)")
+    return parser
+
+def main():
+    args = get_parser().parse_args()
+    knobs = dict(islands=args.islands, island_size=args.island_size, gateways=args.gateways, density=args.density, layout=args.layout, seed=args.seed)
+    results = run(args.sizes, args.radii, args.border, args.repeat, knobs)
+    report = dict(environment=environment(), knobs=knobs, repeat=args.repeat, results=results)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=1)
+    if args.compare:
+        with open(args.compare) as baseline:
+            regressions = compare(json.load(baseline), report, args.threshold)
+        for (stage, size, radius, border), before, after in regressions:
+            print("regression: %s at size %d radius %d, %.4fs -> %.4fs" % (stage, size, radius, before, after))
+        return 1 if regressions else 0
+    for result in results:
+        print("%-18s size %4d radius %3d %s %9.4fs" % (result["stage"], result["size"], result["radius"], "border" if result["border"] else "      ", result["min"]))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+import argparse
+import numpy as np
+
+from starspawn import BlockAct, BlockBalk, BlockCalm, BlockDeath, BlockDirt, BlockFury, BlockHate, BlockLove, BlockPortal, BlockRock, BlockVine, BlockWill
+
+## Synthetic Saves
+#
+# Writes boards in the same \x06 separated format as a game save, so every
+# stage from parsing onwards runs on them. Everything is drawn from one seed,
+# so the same knobs always give the same save.
+
+user_blocks = [block.index for block in (BlockAct, BlockBalk, BlockCalm, BlockDeath, BlockDirt, BlockFury, BlockHate, BlockLove, BlockVine, BlockWill)]
+layouts = ("uniform", "clustered")
+
+steps = np.array([(1, 0), (-1, 0), (0, 1), (0, -1)])
+
+def grow_island(random, size, cells):
+    # a random walk blob of rock, grown from its first cell
+    cells = min(cells, size * size // 2)
+    start = random.integers(size, size=2)
+    island = {tuple(start)}
+    edge = [start]
+    while len(island) < cells:
+        x, y = (edge[random.integers(len(edge))] + steps[random.integers(4)]) % size
+        if (x, y) not in island:
+            island.add((x, y))
+            edge.append(np.array((x, y)))
+    return np.array(sorted(island))
+
+def generate(size=160, islands=40, island_size=30, gateways=1, density=0.02, layout="clustered", seed=0):
+    # tiles as (type, x, y, offset, modifier) rows, in save order
+    random = np.random.default_rng(seed)
+    taken = np.zeros((size, size), dtype=bool)
+    rows = []
+    centers = []
+    for island in range(islands):
+        cells = grow_island(random, size, max(1, int(random.normal(island_size, island_size / 4))))
+        cells = cells[~taken[cells[:, 1], cells[:, 0]]]
+        taken[cells[:, 1], cells[:, 0]] = True
+        rows += [(BlockRock.index, x, y, 0, 0) for x, y in cells.tolist()]
+        centers.append(cells[0] if len(cells) else random.integers(size, size=2))
+        # gateways sit on empty cells next to the rock, like the game's portals
+        around = (cells[:, None, :] + steps[None, :, :]).reshape(-1, 2) % size
+        around = np.unique(around[~taken[around[:, 1], around[:, 0]]], axis=0)
+        for x, y in random.permutation(around)[:gateways].tolist():
+            taken[y, x] = True
+            rows.append((BlockPortal.index, x, y, int(random.integers(2)), 0))
+
+    # user blocks are scattered over the board, or spread out from the islands as players build
+    count = int(density * size * size)
+    if layout == "uniform" or not centers:
+        points = random.integers(size, size=(count, 2))
+    else:
+        near = np.array(centers)[random.integers(len(centers), size=count)]
+        points = np.rint(near + random.normal(0, size / 16, size=(count, 2))).astype(int) % size
+    for x, y in points.tolist():
+        if not taken[y, x]:
+            taken[y, x] = True
+            rows.append((int(random.choice(user_blocks)), x, y, int(random.integers(4)), int(random.integers(2))))
+    return rows
+
+def encode(rows):
+    # a couple of non-tile entries keep the parser's other branch honest
+    entries = [b"\x00MEMbench", b"\x00SUBbench"]
+    entries += [b"\x00%d,%d,%d,%d,%d|0|0" % row for row in rows]
+    entries.append(b"\x00Abench,1")
+    return b"\x06".join(entries) + b"\n"
+
+def write(path, **knobs):
+    with open(path, "wb") as save:
+        save.write(encode(generate(**knobs)))
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="Write a synthetic Starseed Pilgrim save")
+    parser.add_argument("path", help="where to write the save")
+    parser.add_argument("--size", type=int, default=160, help="board size in tiles (default 160)")
+    parser.add_argument("--islands", type=int, default=40, help="number of rock islands (default 40)")
+    parser.add_argument("--island-size", type=int, default=30, help="mean rock tiles per island (default 30)")
+    parser.add_argument("--gateways", type=int, default=1, help="gateways per island (default 1)")
+    parser.add_argument("--density", type=float, default=0.02, help="user blocks as a fraction of the board (default 0.02)")
+    parser.add_argument("--layout", choices=layouts, default="clustered", help="how user blocks are spread (default clustered)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed (default 0)")
+    return parser
+
+if __name__ == "__main__":
+    args = get_parser().parse_args()
+    write(args.path, size=args.size, islands=args.islands, island_size=args.island_size, gateways=args.gateways, density=args.density, layout=args.layout, seed=args.seed)
@@ -0,0 +1,149 @@
+import mmap
+import numpy as np
+
+## Save Layout
+#
+# A save is one line of entries separated by \x06. Each entry starts with a
+# marker byte; tile entries follow it with "type,x,y,offset,modifier|...".
+# Everything else (memories, SUB records, ...) is kept as a lazy Entry.
+
+SEPARATOR = 0x06
+COMMA = ord(",")
+PIPE = ord("|")
+MINUS = ord("-")
+ZERO = ord("0")
+
+## Lazy Entries
+
+class Entry():
+    # a non-tile entry, only copied or decoded when asked for
+    def __init__(self, buffer, start, end):
+        self.buffer = buffer
+        self.start = start
+        self.end = end
+
+    def __len__(self):
+        return self.end - self.start
+
+    @property
+    def raw(self):
+        return bytes(self.buffer[self.start:self.end])
+
+    @property
+    def text(self):
+        return str(self.buffer[self.start + 1:self.end], "utf-8", "replace")
+
+    @property
+    def fields(self):
+        return self.text.split(",")
+
+    @property
+    def is_memory(self):
+        if len(self) < 4:
+            return False
+        head = bytes(self.buffer[self.start + 1:self.start + 4])
+        return chr(head[0]).isupper() and head != b"SUB"
+
+## Tile Records
+
+class Tiles():
+    # tile entries as parallel arrays, in save order
+    def __init__(self, types, xs, ys, offsets, modifiers):
+        self.types = types
+        self.xs = xs
+        self.ys = ys
+        self.offsets = offsets
+        self.modifiers = modifiers
+
+    def __len__(self):
+        return len(self.types)
+
+    def __iter__(self):
+        return zip(self.types.tolist(), self.xs.tolist(), self.ys.tolist(), self.offsets.tolist(), self.modifiers.tolist())
+
+    def fill(self, board):
+        board.place_tiles(self.xs, self.ys, self.types, self.offsets, self.modifiers)
+
+class Save():
+    def __init__(self, buffer, tiles, entries):
+        self.buffer = buffer
+        self.tiles = tiles
+        self.entries = entries
+
+    @property
+    def memories(self):
+        return [entry for entry in self.entries if entry.is_memory]
+
+## Parsing
+
+def parse_ints(data, starts, ends):
+    # decode every [start, end) field of the buffer as a base 10 integer at once
+    lengths = ends - starts
+    if len(starts) == 0:
+        return np.zeros(0, dtype=np.int64)
+    negative = (lengths > 0) & (data[np.minimum(starts, len(data) - 1)] == MINUS)
+    starts = starts + negative
+    lengths = ends - starts
+    if (lengths <= 0).any():
+        raise ValueError("empty integer field in save")
+    width = lengths.max()
+    columns = np.arange(width)
+    inside = columns[None, :] < lengths[:, None]
+    digits = data[np.where(inside, starts[:, None] + columns[None, :], 0)].astype(np.int64) - ZERO
+    if ((digits < 0) | (digits > 9))[inside].any():
+        raise ValueError("invalid integer field in save")
+    # right-align the digits so each column has a fixed place value
+    powers = 10 ** np.maximum(lengths[:, None] - 1 - columns[None, :], 0)
+    values = (np.where(inside, digits, 0) * powers).sum(axis=1)
+    return np.where(negative, -values, values)
+
+def parse(buffer):
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    newline = np.flatnonzero(data == ord("\n"))
+    if len(newline):
+        data = data[:newline[0]]
+    separators = np.flatnonzero(data == SEPARATOR)
+    starts = np.concatenate(([0], separators + 1))
+    ends = np.concatenate((separators, [len(data)]))
+
+    # tile entries have at least four commas after their marker byte
+    commas = np.flatnonzero(data == COMMA)
+    first = np.searchsorted(commas, starts + 1)
+    count = np.searchsorted(commas, ends) - first
+    is_tile = count >= 4
+
+    tile_starts = starts[is_tile] + 1
+    tile_ends = ends[is_tile]
+    first = first[is_tile]
+    bounds = [tile_starts] + [commas[first + i] for i in range(4)]
+
+    # the modifier runs to the next comma, pipe or the end of the entry
+    pipes = np.flatnonzero(data == PIPE)
+    field_end = tile_ends.copy()
+    has_comma = count[is_tile] > 4
+    field_end[has_comma] = commas[first[has_comma] + 4]
+    next_pipe = np.searchsorted(pipes, bounds[4] + 1)
+    has_pipe = next_pipe < len(pipes)
+    field_end[has_pipe] = np.minimum(field_end[has_pipe], pipes[next_pipe[has_pipe]])
+
+    fields = []
+    for i in range(5):
+        start = bounds[i] + (1 if i else 0)
+        end = bounds[i + 1] if i < 4 else field_end
+        fields.append(parse_ints(data, start, end))
+    tiles = Tiles(*fields)
+
+    entries = [Entry(buffer, start, end) for start, end in zip(starts[~is_tile].tolist(), ends[~is_tile].tolist())]
+    return Save(buffer, tiles, entries)
+
+def read(path):
+    # mapped rather than read, so tile fields are decoded straight from the file
+    with open(path, "rb") as save:
+        try:
+            return mmap.mmap(save.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files cannot be mapped
+            return b""
+
+def load(path):
+    return parse(read(path))
@@ -1,730 +1,2223 @@
-from PIL import Image, ImageFilter, ImageColor
-from queue import SimpleQueue as queue
-from enum import Enum
-import argparse, random
-
-## Argument Parsing
-
-parser = argparse.ArgumentParser(description="Visualizer for Starseed Pilgrim", usage="%(prog)s [options]")
-parser.add_argument("-f", "--file", nargs="?", default="star.save", help="save file location (default: star.save)")
-parser.add_argument("-b", "--border", action='store_true', help="Enable 2x tile mode")
-parser.add_argument("-s", "--scale", nargs=1, type=float, default=1, help="scale image linearly")
-
-group_hidden = parser.add_mutually_exclusive_group()
-group_hidden.add_argument("-r", "--radius", nargs=1, type=int, default=10, help="set island hide radius (default 10)")
-group_hidden.add_argument("-v", "--visible", action='store_true', help="reveal all tiles")
-
-group_offset = parser.add_mutually_exclusive_group()
-group_offset.add_argument('-o', '--offset', nargs=2, type=int, action='store', default=[0, 0], metavar = ("X", "Y"), help="manually offset image")
-parser.add_argument("-a", "--auto", action="store_true", help="automatically offset image based on unoccupied rows or columns")
-
-group_tile = parser.add_mutually_exclusive_group()
-group_tile.add_argument("-t", "--tile", action='store_true', help='use 12x12 tileset (EXPERIMENTAL)')
-group_tile.add_argument("-p", "--pixel", action='store_true', help='use pixel tileset')
-
-## Initial File Imports
-
-sheet_small = Image.open("SPsmall.png")    
-sheet_large = Image.open("SP.png")
-
-empty_small = Image.new("RGBA", (12, 12), ImageColor.colormap["white"])
-empty_large = Image.new("RGBA", (24, 24), ImageColor.colormap["white"])
-
-def tileAt(x, y):
-    small = sheet_small.crop((x*12, y*12, (x+1)*12, (y+1)*12))
-    large = sheet_large.crop((x*24, y*24, (x+1)*24, (y+1)*24))
-    return large, small
-    
-def translucent(image):
-    result = image.copy()
-    result.putalpha(128)
-    return result
-
-## Logical Tile Generators
-
-def perimeter(start, radius, mod):
-    for i in range(-radius, radius+1):
-        yield (start[0] + radius) % mod, (start[1] + i) % mod
-        yield (start[0] - radius) % mod, (start[1] + i) % mod
-        yield (start[0] + i) % mod, (start[1] + radius) % mod
-        yield (start[0] + i) % mod, (start[1] - radius) % mod
-
-def surround(start, rel, mod):
-    for i in range(-2, 3):
-        for j in range(-2, 3):
-            coord = ((start[0] + i) % mod, (start[1] + j) % mod)
-            c_rel = (rel[0]+i, rel[1]+j)
-            yield coord, c_rel
-            
-def neighbors(start, mod):
-    for dir in Border:
-            yield ((start[0] + dir.value[0]) % mod, (start[1] + dir.value[1]) % mod), dir
-
-## Tile Definitions
-
-class Border(Enum):
-    TOP = (0, -1)
-    LEFT = (-1, 0)
-    RIGHT = (1, 0)
-    BOTTOM = (0, 1)
-    
-    def opposite(self):
-        if self == Border.TOP:
-            return Border.BOTTOM
-        if self == Border.LEFT:
-            return Border.RIGHT
-        if self == Border.RIGHT:
-            return Border.LEFT
-        if self == Border.BOTTOM:
-            return Border.TOP
-            
-    @staticmethod
-    def sheet_pos(neighbor_set):
-        x, y = 0, 0
-        if Border.LEFT in neighbor_set:
-            if Border.RIGHT in neighbor_set:
-                x = 1
-            else:
-                x = 2
-        else:
-            if Border.RIGHT in neighbor_set:
-                x = 0
-            else:
-                x = 3
-        if Border.TOP in neighbor_set:
-            if Border.BOTTOM in neighbor_set:
-                y = 1
-            else:
-                y = 2
-        else:
-            if Border.BOTTOM in neighbor_set:
-                y = 0
-            else:
-                y = 3
-        return x, y
-
-class Block():
-    all_blocks = dict()
-    tiles = (tileAt(0, 0),)
-    colors = ((158, 87, 21),)
-    index = 4
-    def __init__(self, offset, modifier):
-        self.tile = self.tiles[0]
-        self.color = self.colors[0]
-            
-    def get_tile(self, small=False):
-        if small:
-            return self.tile[1]
-        else:
-            return self.tile[0]
-            
-    def get_color(self):
-        return self.color
-        
-    def add_neighbor(self, pos, index):
-        pass
-        
-    def remove_neighbor(self, pos, index):
-        pass
-        
-    def clear_neighbors(self):
-        pass
-        
-    @staticmethod
-    def from_data(data):
-        block_type = Block.all_blocks[int(data[0])]
-        offset = int(data[3])
-        modifier = int(data[4])
-        return block_type(offset, modifier)
-        
-        
-class BlockBordered(Block):
-    light_color = (203, 109, 17)
-    dark_color = (125, 66, 9)
-    generated = False
-    sheets = []
-    
-    
-    def __init__(self, offset, modifier):
-        super().__init__(offset, modifier)
-        self.neighbors = set()
-        if not type(self).generated:
-            self.sheets.append(self.generate_borders(self.tile))
-            type(self).generated = True
-        self.sheet, self.sheet_small = self.sheets[0]
-            
-    def get_tile(self, small=False):
-        x, y = Border.sheet_pos(self.neighbors)
-        if small:
-            return self.sheet_small.crop((x*12, y*12, (x+1)*12, (y+1)*12))
-        else:
-            return self.sheet.crop((x*24, y*24, (x+1)*24, (y+1)*24))
-        
-    def add_neighbor(self, pos, index):
-        self.neighbors.add(pos)
-        
-    def remove_neighbor(self, pos, index):
-        self.neighbors.remove(pos)
-        
-    def clear_neighbors(self):
-        self.neighbors.clear()
-        
-    def generate_borders(self, tile):
-        sheet = Image.new("RGBA", (96, 96), ImageColor.colormap["white"])
-        sheet_small = Image.new("RGBA", (48, 48), ImageColor.colormap["white"])
-        px = sheet.load()
-        px_small = sheet_small.load()
-        for i in range(4):
-            for j in range(4):
-                sheet.paste(tile[0], (i*24, j*24))
-                sheet_small.paste(tile[1], (i*12, j*12))
-        
-        edge_set = set((0, 23, 24, 47, 48, 71, 72, 95))         
-        for i in range(96):
-            # general edges
-            # top
-            px[95-i, 0] = self.light_color
-            px[95-i, 72] = self.light_color
-            # right
-            px[95, 95-i] = self.light_color
-            px[71, 95-i] = self.light_color
-            # bottom
-            px[i, 95] = self.dark_color
-            px[i, 71] = self.dark_color
-            # left
-            px[0, i] = self.dark_color
-            px[72, i] = self.dark_color
-            
-            if i not in edge_set:
-                # bevel
-                # top
-                px[95-i, 1] = self.light_color
-                px[95-i, 73] = self.light_color
-                # right
-                px[94, 95-i] = self.light_color
-                px[70, 95-i] = self.light_color
-                # bottom
-                px[i, 94] = self.dark_color
-                px[i, 70] = self.dark_color
-                # left
-                px[1, i] = self.dark_color
-                px[73, i] = self.dark_color
-
-        for i in range(48):
-            # general edges
-            # top
-            px_small[47-i, 0] = self.light_color
-            px_small[47-i, 36] = self.light_color
-            # right
-            px_small[47, 47-i] = self.light_color
-            px_small[35, 47-i] = self.light_color
-            # bottom
-            px_small[i, 47] = self.dark_color
-            px_small[i, 35] = self.dark_color
-            # left
-            px_small[0, i] = self.dark_color
-            px_small[36, i] = self.dark_color
-            
-            if i not in edge_set:
-                # bevel
-                # top
-                px_small[47-i, 1] = self.light_color
-                px_small[47-i, 37] = self.light_color
-                # right
-                px_small[46, 47-i] = self.light_color
-                px_small[34, 47-i] = self.light_color
-                # bottom
-                px_small[i, 46] = self.dark_color
-                px_small[i, 34] = self.dark_color
-                # left
-                px_small[1, i] = self.dark_color
-                px_small[37, i] = self.dark_color
-                
-            
-        return sheet, sheet_small
-                
-    
-class BlockAct(Block):
-    # blue (boost)
-    tiles = (tileAt(6, 2),)
-    colors = ((0, 138, 255),)
-    index = 0
-    
-class BlockBalk(Block):
-    # d_green (anchor)
-    tiles = (tileAt(4, 2), tileAt(5, 2))
-    colors = ((173, 173, 25),)
-    index = 1
-    
-    
-class BlockCalm(Block):
-    # l_blue (ice)
-    tiles = (tileAt(0, 3),)
-    colors = ((163, 237, 255),)
-    index = 2
-    
-class BlockDeath(Block):
-    # spooky scary
-    colors = ((0, 0, 0),)
-    index = 3
-    
-class BlockDeathGhost(Block):
-    # spooky scary
-    colors = ((208, 208, 208),)
-    index = 3
-    
-class BlockDeathWandering(Block):
-    # spooky scary
-    colors = ((208, 208, 208),)
-    index = 3
-    
-class BlockDirt(Block):
-    # dirt
-    tiles = (tileAt(0, 4), tileAt(0, 5), tileAt(0, 6), tileAt(0, 7))
-    colors = ((158, 87, 21), (129, 51, 0))
-    index = 4
-    
-    def __init__(self, offset, modifier):
-        super().__init__(offset, modifier)
-        tile = random.randint(0, 3)
-        self.tile = self.tiles[tile]
-        self.color = colors[tile // 2]
-    
-class BlockFury(Block):
-    # orange (arrow)
-    tiles = (tileAt(0, 2), tileAt(1, 2), tileAt(2, 2), tileAt(3, 2), )
-    colors = ((255, 168, 0),)
-    index = 5
-              
-    def __init__(self, offset, modifier):
-        # TODO: Verify modifier
-        super().__init__(offset, modifier)
-        if modifier == 0:
-            self.tile = self.tiles[3]
-        else:
-            if offset == 2:
-                self.tile = self.tiles[0]
-            elif offset == 0:
-                self.tile = self.tiles[1]
-            else:
-                self.tile = self.tiles[2]
-    
-    
-class BlockHate(Block):
-    # red (mine)
-    tiles = (tileAt(6, 1), tileAt(7, 3))
-    colors = ((237, 0, 0),)
-    index = 6           
-    
-    def __init__(self, offset, modifier):
-        super().__init__(offset, modifier)
-        if offset == 2:
-            self.tile = self.tiles[0]
-        else:
-            self.tile = self.tiles[1]
-    
-class BlockLove(Block):
-    # pink (love)
-    tiles = (tileAt(0, 1), tileAt(1, 1), tileAt(2, 1), tileAt(3, 1))
-    colors = ((255, 85, 205),)
-    index = 7
-    
-    def __init__(self, offset, modifier):
-        self.tile = random.choice(self.tiles)
-        self.color = self.colors[0]
-    
-    
-class BlockPortal(Block):
-    # portal
-    tiles = (tileAt(4, 3), tileAt(5, 3))
-    colors = ((109, 129, 144), (255, 254, 199))
-    index = 11
-    
-    def __init__(self, offset, modifier):
-        # TODO: Correct offset
-        super().__init__(offset, modifier)
-        if offset == 1:
-            self.tile = self.tiles[0]
-            self.color = self.colors[0]
-        else:
-            self.tile = self.tiles[1]
-            self.color = self.colors[1]
-    
-class BlockRock(BlockBordered):
-    # structure
-    tiles = (tileAt(7, 2),)
-    colors = ((109, 129, 144),)
-    index = 10
-    light_color = (139, 164, 182)
-    dark_color = (60, 79, 94)
-        
-    def add_neighbor(self, pos, index):
-        if index == BlockRock.index:
-            self.neighbors.add(pos)
-        
-    def remove_neighbor(self, pos, index):
-        if index == BlockRock.index:
-            self.neighbors.remove(pos)
-    
-class BlockVine(BlockBordered):
-    # green (garden)
-    tiles = (tileAt(1, 3),)
-    colors = ((148, 232, 16),)
-    index = 8  
-    light_color = (196, 254, 37)
-    dark_color = (119, 216, 3)
-    sheets = []
-    def __init__(self, offset, modifier):
-        if BlockVine.generated == False:
-            for i in range(8):
-                rotate = (i % 4) * 90
-                flip = i // 4
-                tile = [self.tiles[0][0].copy(), self.tiles[0][1].copy()]
-                if flip:
-                    tile[0] = tile[0].transpose(Image.FLIP_LEFT_RIGHT)
-                    tile[1] = tile[1].transpose(Image.FLIP_LEFT_RIGHT)
-                tile[0] = tile[0].rotate(rotate)
-                tile[1] = tile[1].rotate(rotate)
-                self.sheets.append(self.generate_borders(tile))
-            BlockVine.generated = True
-        super().__init__(offset, modifier)
-        self.sheet, self.sheet_small = random.choice(self.sheets)
-    
-    
-class BlockVoid(Block):
-    # void
-    pass
-    
-class BlockWill(Block):
-    # purple (pylon)
-    tiles = (tileAt(4, 1), tileAt(5, 1))
-    colors = ((153, 98, 223),)
-    index = 9
-    
-    def __init__(self, offset, modifier):
-        super().__init__(offset, modifier)
-        self.tile = random.choice(self.tiles)
-
-## SP Block Dictionaries
-
-Block.all_blocks[BlockAct.index] = BlockAct
-Block.all_blocks[BlockBalk.index] = BlockBalk
-Block.all_blocks[BlockCalm.index] = BlockCalm
-Block.all_blocks[BlockDeath.index] = BlockDeath
-Block.all_blocks[BlockDirt.index] = BlockDirt
-Block.all_blocks[BlockFury.index] = BlockFury
-Block.all_blocks[BlockHate.index] = BlockHate
-Block.all_blocks[BlockLove.index] = BlockLove
-Block.all_blocks[BlockPortal.index] = BlockPortal
-Block.all_blocks[BlockRock.index] = BlockRock
-Block.all_blocks[BlockVine.index] = BlockVine
-Block.all_blocks[BlockWill.index] = BlockWill
-            
-## SPBoard Class
-
-class SPBoard():
-    def __init__(self, size, scale=1, border=False, auto_offset=False, offset=(0, 0), visible=-1):
-        self.view_size = size * (2 if border else 1)
-        self.size = size
-        self.scale = scale
-        self.border = border
-        self.auto_offset = auto_offset
-        self.offset = offset
-        self.visible = visible
-        self.rendered = False
-        self.map = dict()
-        self.hidden = dict()
-        self.gateways = set()
-        self.structs = set()
-        self.user = set()
-        
-    def place(self, x, y, block):
-        x = x % self.view_size
-        y = y % self.view_size
-        self.map[(x, y)] = block
-        self.set_neighbors(x, y)
-        self.add_to_sort(x, y, block.index)
-            
-    def set_neighbors(self, x, y):
-        block = self.map[(x, y)]
-        for neighbor, dir in neighbors((x, y), self.size):
-            if neighbor in self.map:
-                block_near = self.map[neighbor]
-                block.add_neighbor(dir, block_near.index)
-                block_near.add_neighbor(dir.opposite(), block.index)
-                             
-    def remove_neighbors(self, x, y):
-        block = self.map[(x, y)]
-        for neighbor, dir in neighbors((x, y), self.size):
-            if neighbor in self.map:
-                block_near = self.map[neighbor]
-                block.remove_neighbor(dir, block_near.index)
-                block_near.remove_neighbor(dir.opposite(), block.index)   
-    
-    def show(self, x, y):
-        if (x, y) in self.hidden:
-            block = self.hidden[(x, y)]
-            self.map[(x, y)] = self.hidden[(x, y)]
-            self.set_neighbors(x, y)
-            self.hidden.pop((x, y))
-            self.add_to_sort(x, y, block.index)
-            
-    def add_to_sort(self, x, y, index):
-        if index == BlockPortal.index:
-            self.gateways.add((x, y))
-        elif index == BlockRock.index:
-            self.structs.add((x, y))
-        elif index != BlockDirt.index:
-            self.user.add((x, y))
-        
-    def hide(self, x, y):
-        if (x, y) in self.map:
-            block = self.map[(x, y)]
-            self.hidden[(x, y)] = block
-            self.remove_neighbors(x, y)
-            self.map.pop((x, y))
-            self.remove_from_sort(x, y, block.index)
-            
-    def remove_from_sort(self, x, y, index):
-        if index == BlockPortal.index:
-            self.gateways.remove((x, y))
-        elif index == BlockRock.index:
-            self.structs.remove((x, y))
-        elif index != BlockDirt.index:
-            self.user.remove((x, y))
-            
-    def set_all_visible(self):
-        for coord in self.hidden:
-            self.show(*coord)
-            
-    def shift(self, xoffset, yoffset):
-        self.check_render()
-        xsplit = self.view_size - xoffset
-        ysplit = self.view_size - yoffset
-        for image, scale in [(self.image, 1), (self.tile_image, 12), (self.original, 24)]:
-            tl = image.crop((0, 0, xsplit*scale, ysplit*scale))
-            tr = image.crop((xsplit*scale, 0, self.view_size*scale, ysplit*scale))
-            bl = image.crop((0, ysplit*scale, xsplit*scale, self.view_size*scale))
-            br = image.crop((xsplit*scale, ysplit*scale, self.view_size*scale, self.view_size*scale))
-            image.paste(tl, (xoffset*scale, yoffset*scale))
-            image.paste(tr, (0, yoffset*scale))
-            image.paste(bl, (xoffset*scale, 0))
-            image.paste(br, (0, 0))        
-            
-    def render(self):
-        if self.visible > 0:
-            self.mark_unseen(self.visible)
-        self.image = Image.new("RGBA", (self.view_size, self.view_size), ImageColor.colormap["white"])
-        self.tile_image = Image.new("RGBA", (self.view_size*12, self.view_size*12), ImageColor.colormap["white"])
-        self.original = Image.new("RGBA", (self.view_size*24, self.view_size*24), ImageColor.colormap["white"])
-        self.px = self.image.load()
-        if self.auto_offset:
-            offset = self.find_offset()
-        else:
-            offset = self.offset
-        for x, y in self.map:
-            block = self.map[x, y]
-            if self.border:
-                coords = [((x - self.size // 2) % self.view_size, (y - self.size // 2) % self.view_size),
-                          ((x - self.size // 2) % self.view_size, (y + self.size // 2) % self.view_size),
-                          ((x + self.size // 2) % self.view_size, (y - self.size // 2) % self.view_size),
-                          ((x + self.size // 2) % self.view_size, (y + self.size // 2) % self.view_size)]
-            else:
-                coords = [(x, y)]
-            for cx, cy in coords:
-                self.px[cx, cy] = block.get_color()
-                self.tile_image.paste(block.get_tile(small=True), (cx*12, cy*12))
-                self.original.paste(block.get_tile(small=False), (cx*24, cy*24))
-        self.rendered = True
-        self.shift(*offset)
-    
-    def check_render(self):
-        if not self.rendered:
-            self.render()
-        
-    def view_px(self):
-        self.check_render()
-        if self.scale == 1:
-            output = self.image
-        else:
-            output = self.image.resize((self.size*self.scale, self.size*self.scale))
-        output.show()
-        
-    def view_small(self):
-        self.check_render()
-        if self.scale == 1:
-            output = self.tile_image
-        else:
-            output = self.tile_image.resize((self.size*self.scale, self.size*self.scale))
-        output.show()
-        
-    def view_original(self):
-        self.check_render()
-        if self.scale == 1:
-            output = self.original
-        else:
-            output = self.original.resize((self.size*self.scale, self.size*self.scale))
-        output.show()
-        
-    def can_see(self, tiles, range):
-        for given_tile in tiles:
-            for tile in perimeter(given_tile, range, self.size):
-                if tile in self.user:
-                    return True
-        return False
-        
-    def find_island(self, x, y):
-        if (x, y) not in self.map:
-            return None, None, None
-        first = ((x, y), (0, 0))
-        gateway = None
-        bounds = [0, 0, 0, 0]
-        next = queue()
-        search = set()
-        islands = set()
-        next.put(first)
-        while not next.empty():
-            for cell in surround(*next.get(), self.size):
-                if cell not in search:
-                    search.add(cell)
-                    coord, rel = cell
-                    # TODO: FIX (edit: thanks, me)
-                    if coord in self.structs:
-                        islands.add(coord)
-                        next.put(cell)
-                        if (rel[0] < bounds[0]):
-                            bounds[0] = rel[0]
-                        if (rel[1] < bounds[1]):
-                            bounds[1] = rel[1]
-                        if (rel[0] > bounds[2]):
-                            bounds[2] = rel[0]
-                        if (rel[1] > bounds[3]):
-                            bounds[3] = rel[1]
-                    if coord in self.gateways:
-                        gateway = coord
-        island_size = (bounds[2] - bounds[0], bounds[3] - bounds[1])
-        return islands, gateway, island_size
-
-    def mark_unseen(self, range):
-        # TODO: Split into find_islands and is_hidden
-        self.set_all_visible()
-        unsearched = self.structs.copy()
-        found = set()
-
-        while len(unsearched) > 0:
-            next = unsearched.pop()
-            uncheck, gateway, island_size = self.find_island(*next)
-            for struct in uncheck:
-                if struct in unsearched:
-                    unsearched.remove(struct)
-            found.add((next, gateway, island_size))
-            if not self.can_see(uncheck, range):
-                for tile in uncheck:
-                    self.hide(*tile)
-                if gateway:
-                    self.hide(*gateway)
-            
-    def find_offset(self):          
-        row_written = [0 for i in range(board.size)]            
-        col_written = [0 for i in range(board.size)]
-        
-        for row in range(board.size):
-            for col in range(board.size):
-                if (col, row) in self.map:
-                    row_written[row] = 1
-                    break
-        
-        for col in range(board.size):
-            for row in range(board.size):
-                if (col, row) in self.map:
-                    col_written[col] = 1
-                    break
-                    
-        xoffset = 0
-        yoffset = 0
-        if len(self.map) > 0:
-            index = 0
-            run_max = 0
-            while index < self.size:
-                if col_written[index]:
-                    index += 1
-                else:
-                    start = index
-                    run = 0
-                    while not col_written[index]:
-                        run += 1
-                        index = (index + 1) % self.size
-                    if run > run_max:
-                        run_max = run
-                        xoffset = self.size - ((start + run // 2) % self.size)
-            index = 0
-            run_max = 0
-            while index < self.size:
-                if row_written[index]:
-                    index += 1
-                else:
-                    start = index
-                    run = 0
-                    while not row_written[index]:
-                        run += 1
-                        index = (index + 1) % self.size
-                    if run > run_max:
-                        run_max = run
-                        yoffset = self.size - ((start + run // 2) % self.size)
-    
-        return xoffset, yoffset
-
-## Main Entrypoint
-
-def main():    
-    global board # Debugging global
-    args = parser.parse_args()
-    
-    size = 160
-    file = args.file
-    scale = args.scale
-    if args.auto:
-        auto_offset = True
-        offset = (0, 0)
-    else:
-        auto_offset = False
-        offset = args.offset
-    border = args.border
-    if args.visible:
-        visible = -1
-    else:
-        visible = args.radius
-    use_tile = args.tile
-    use_pixel = args.pixel
-
-    with open(file, "rb") as save:
-        data = save.readline()
-    
-    board = SPBoard(size, scale=scale, border=border, auto_offset=auto_offset, offset=offset, visible=visible) 
-
-    data_entries = data.split(b"\x06")
-    
-    data_extract = [d[1:].split(b",")[:5] for d in data_entries]
-    data_tiles = [[*d[:4], *d[4].split(b'|')] for d in data_extract if len(d) == 5]
-    data_mem = [d for d in data_entries if chr(d[1]).isupper() and str(d[1:4], "utf-8") != "SUB"]
-    
-    for tile in data_tiles:
-        block = Block.from_data(tile)
-        x = int(tile[1])
-        y = int(tile[2])
-        board.place(x, y, block) 
-        
-    if use_pixel:
-        board.view_px()
-    elif use_tile:
-        board.view_small()
-    else:
-        board.view_original()
-
-if __name__ == "__main__":
-    board = None
-    main()
-
-
-
-
+from PIL import Image, ImageChops, ImageFilter, ImageColor
+from enum import Enum
+from contextlib import nullcontext
+import argparse, glob, hashlib, io, json, mmap, os, struct, sys, threading, time, zipfile, zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from stat import S_ISSOCK
+from urllib.parse import parse_qs, urlsplit
+import numpy as np
+import starsave
+
+## Argument Parsing
+
+parser = None
+
+def get_parser():
+    # built on first use, so importing the module for its API stays cheap
+    global parser
+    if parser is not None:
+        return parser
+    parser = argparse.ArgumentParser(description="Visualizer for Starseed Pilgrim", usage="%(prog)s [options]")
+    parser.add_argument("-f", "--file", nargs="?", default="star.save", help="save file location (default: star.save)")
+    parser.add_argument("-b", "--border", action='store_true', help="Enable 2x tile mode")
+    parser.add_argument("-s", "--scale", type=float, default=1, help="scale image linearly, composited at the scaled tile size (default 1)")
+
+    group_hidden = parser.add_mutually_exclusive_group()
+    group_hidden.add_argument("-r", "--radius", nargs="+", type=int, default=[10], help="set island hide radius, or several to sweep (default 10)")
+    group_hidden.add_argument("-v", "--visible", action='store_true', help="reveal all tiles")
+
+    group_offset = parser.add_mutually_exclusive_group()
+    group_offset.add_argument('-o', '--offset', nargs=2, type=int, action='store', default=[0, 0], metavar = ("X", "Y"), help="manually offset image")
+    parser.add_argument("-a", "--auto", nargs="?", const="gaps", choices=offset_modes, help="automatically offset the image: through the widest empty rows and columns (gaps, the default), centering the largest cluster, or splitting the fewest islands")
+
+    group_tile = parser.add_mutually_exclusive_group()
+    group_tile.add_argument("-t", "--tile", action='store_true', help='use 12x12 tileset (EXPERIMENTAL)')
+    group_tile.add_argument("-p", "--pixel", action='store_true', help='use pixel tileset')
+
+    parser.add_argument("--output", metavar="PATH", help="write the image to PATH (.png or .webp) instead of showing it")
+    parser.add_argument("--compress", type=int, choices=range(10), default=6, metavar="0-9", help="output compression level (default 6)")
+    parser.add_argument("--threads", type=int, default=None, metavar="N", help="threads for compositing and encoding (default: all cores, 1 per batch worker)")
+
+    group_region = parser.add_argument_group("region rendering")
+    group_region.add_argument("--region", nargs=4, type=int, metavar=("X", "Y", "W", "H"), help="render only this window of the wrapped board, in tiles")
+    group_region.add_argument("--block-size", type=int, default=None, metavar="PX", help="pixels per tile for --region, up or down from the tileset's own size (default: the tileset's size)")
+
+    group_pyramid = parser.add_argument_group("tile pyramid")
+    group_pyramid.add_argument("--pyramid", metavar="PATH", help="write a Deep Zoom pyramid (PATH.dzi and PATH_files) of the full map")
+    group_pyramid.add_argument("--tile-size", type=int, default=256, help="pyramid tile size in pixels (default 256)")
+
+    parser.add_argument("--snapshot", metavar="PATH", help="write the parsed board, with hidden islands marked, to PATH instead of rendering; render it later with -f PATH")
+
+    group_cache = parser.add_argument_group("render cache")
+    group_cache.add_argument("-c", "--cache", action="store_true", help="reuse renders of the same save and options from disk")
+    group_cache.add_argument("--cache-size", type=int, default=1024, metavar="MB", help="render cache size limit (default 1024)")
+
+    group_watch = parser.add_argument_group("watch mode")
+    group_watch.add_argument("-w", "--watch", action="store_true", help="keep --output updated while the save changes")
+    group_watch.add_argument("--interval", type=float, default=0.5, help="seconds between save checks (default 0.5)")
+
+    group_batch = parser.add_argument_group("batch rendering")
+    group_batch.add_argument("--batch", metavar="SOURCE", help="render every save in a directory or glob, writing into the --output directory")
+    group_batch.add_argument("-j", "--jobs", type=int, default=None, help="number of worker processes, or concurrent renders for --serve (default: all cores)")
+    group_batch.add_argument("--format", choices=output_formats, default="png", help="batch and pyramid output format (default png)")
+
+    group_serve = parser.add_argument_group("render server")
+    group_serve.add_argument("--serve", metavar="ADDRESS", help="serve render requests over HTTP on a localhost PORT, loopback HOST:PORT or Unix socket path")
+    group_serve.add_argument("--boards", type=int, default=32, help="parsed boards kept in memory by --serve (default 32)")
+
+    parser.add_argument("--profile", nargs="?", const="text", choices=("text", "json"), help="print phase timings and hot path counters to stderr when done")
+    return parser
+
+## Profiling
+
+class Profile():
+    # Wall time per phase and counts along the hot paths. While disabled a
+    # phase is a shared no-op context and a count is one attribute check.
+    def __init__(self):
+        self.enabled = False
+        self.reset()
+        
+    def reset(self):
+        self.times = dict()
+        self.calls = dict()
+        self.counts = dict()
+        
+    def enable(self):
+        self.enabled = True
+        
+    def disable(self):
+        self.enabled = False
+        
+    def phase(self, name):
+        return Phase(self, name) if self.enabled else idle_phase
+        
+    def count(self, name, amount=1):
+        if self.enabled:
+            self.counts[name] = self.counts.get(name, 0) + int(amount)
+            
+    def add_time(self, name, elapsed, calls=1):
+        self.times[name] = self.times.get(name, 0) + elapsed
+        self.calls[name] = self.calls.get(name, 0) + calls
+        
+    def merge(self, stats):
+        # fold in another process's as_dict()
+        for name, phase in stats["phases"].items():
+            self.add_time(name, phase["seconds"], phase["calls"])
+        for name, amount in stats["counters"].items():
+            self.counts[name] = self.counts.get(name, 0) + amount
+        
+    def as_dict(self):
+        phases = {name: dict(seconds=self.times[name], calls=self.calls[name]) for name in self.times}
+        return dict(phases=phases, counters=dict(self.counts))
+        
+    def report(self, format="text"):
+        if format == "json":
+            return json.dumps(self.as_dict(), indent=1)
+        # phases nest, so times are inclusive and listed in first use order
+        lines = ["%-14s %10s %7s" % ("phase", "seconds", "calls")]
+        lines += ["%-14s %10.4f %7d" % (name, self.times[name], self.calls[name]) for name in self.times]
+        lines += ["", "%-14s %18s" % ("counter", "count")]
+        lines += ["%-14s %18d" % (name, amount) for name, amount in self.counts.items()]
+        return "\n".join(lines)
+
+class Phase():
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+        
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+        
+    def __exit__(self, *exception):
+        self.profile.add_time(self.name, time.perf_counter() - self.start)
+
+idle_phase = nullcontext()
+profile = Profile()
+
+## Tileset Loading
+
+asset_dir = os.path.dirname(os.path.abspath(__file__))
+tileset_files = ("SP.png", "SPsmall.png")
+sheets = dict()
+
+def tileset():
+    # opened on first use rather than at import
+    if not sheets:
+        sheets["large"] = Image.open(os.path.join(asset_dir, "SP.png"))
+        sheets["small"] = Image.open(os.path.join(asset_dir, "SPsmall.png"))
+    return sheets["large"], sheets["small"]
+    
+def tileset_hash():
+    digest = hashlib.sha256(b"atlas %d" % atlas_version)
+    for name in tileset_files:
+        with open(os.path.join(asset_dir, name), "rb") as asset:
+            digest.update(asset.read())
+    return digest.hexdigest()[:16]
+    
+def cache_dir():
+    root = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.environ.get("STARSPAWN_CACHE") or os.path.join(root, "starspawn")
+    
+def write_atomic(path, writer):
+    # written aside and renamed, so readers never see a partial file
+    temp = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        with open(temp, "wb") as output:
+            writer(output)
+        os.replace(temp, path)
+    except BaseException:
+        try:
+            os.remove(temp)
+        except OSError:
+            pass
+        raise
+
+def tileAt(x, y):
+    sheet_large, sheet_small = tileset()
+    profile.count("tile crops", 2)
+    small = sheet_small.crop((x*12, y*12, (x+1)*12, (y+1)*12))
+    large = sheet_large.crop((x*24, y*24, (x+1)*24, (y+1)*24))
+    return large, small
+    
+def translucent(image):
+    result = image.copy()
+    result.putalpha(128)
+    return result
+
+## Logical Tile Generators
+
+def coord_hash(xs, ys):
+    # stable per-cell noise, so a save draws the same variants on every render
+    xs = np.asarray(xs).astype(np.uint32)
+    ys = np.asarray(ys).astype(np.uint32)
+    h = xs * np.uint32(0x9E3779B1) ^ ys * np.uint32(0x85EBCA77)
+    h ^= h >> np.uint32(15)
+    h *= np.uint32(0x2C1B3C6D)
+    h ^= h >> np.uint32(12)
+    return h
+    
+def window(reach):
+    for i in range(-reach, reach+1):
+        for j in range(-reach, reach+1):
+            yield i, j
+
+## Island Labeling
+
+def label_torus(mask, reach=2):
+    # Union-find over a wrapped grid, joining cells within `reach` of each
+    # other. Roots are hooked onto the lowest neighboring root and then fully
+    # compressed, so only a handful of whole-grid passes are needed.
+    cells = np.flatnonzero(mask)
+    parent = np.arange(mask.size)
+    missing = mask.size
+    while True:
+        roots = np.where(mask, parent.reshape(mask.shape), missing)
+        lowest = roots.copy()
+        for i, j in window(reach):
+            np.minimum(lowest, np.roll(roots, (j, i), axis=(0, 1)), out=lowest)
+        profile.count("label visits", len(cells))
+        cell_roots = roots.flat[cells]
+        cell_lowest = lowest.flat[cells]
+        if (cell_lowest == cell_roots).all():
+            break
+        np.minimum.at(parent, cell_roots, cell_lowest)
+        while True:
+            grand = parent[parent]
+            if (grand == parent).all():
+                break
+            parent = grand
+    labels = np.zeros(mask.shape, dtype=np.int32)
+    roots, inverse = np.unique(cell_roots, return_inverse=True)
+    labels.flat[cells] = inverse + 1
+    return labels, len(roots)
+    
+def island_cells(labels, count):
+    # the (x, y) cells of every label from 1 to count, each in row-major order
+    ys, xs = np.nonzero(labels)
+    order = np.argsort(labels[ys, xs], kind="stable")
+    splits = np.cumsum(np.bincount(labels[ys, xs], minlength=count + 1)[1:])[:-1]
+    return np.split(np.stack((xs[order], ys[order]), axis=1), splits)
+    
+def wrapped_bounds(coords, mod):
+    # first position and length of a set of positions on a ring, measured across the largest gap
+    occupied = np.unique(coords)
+    gaps = np.diff(occupied, append=occupied[0] + mod) - 1
+    widest = np.argmax(gaps)
+    return int(occupied[(widest + 1) % len(occupied)]), int(mod - gaps[widest])
+
+class Island():
+    # One structure island of the fully visible board. Bounds are x, y,
+    # width, height in board tiles and may run past the edge to wrap.
+    def __init__(self, label, cells, gateway, bounds):
+        self.label = label
+        self.cells = cells
+        self.gateway = gateway
+        self.bounds = bounds
+        # tiles to the nearest user block, filled in by SPBoard.island_catalog
+        self.distance = None
+        # mode -> (image, mask) of the island's own tiles over its bounds
+        self.sprites = dict()
+        
+    def __len__(self):
+        return len(self.cells)
+        
+    def __repr__(self):
+        return "Island(%d, %d tiles at %s)" % (self.label, len(self), self.bounds)
+        
+    @property
+    def island_size(self):
+        # extent past the first tile, as the original hiding code measured it
+        return self.bounds[2] - 1, self.bounds[3] - 1
+        
+    def overlaps(self, x, y, width, height, size):
+        # whether the wrapped box shares any column and any row with the bounds
+        def axis(start, length, other, other_length):
+            return (other - start) % size < length or (start - other) % size < other_length
+        return axis(self.bounds[0], self.bounds[2], x, width) and axis(self.bounds[1], self.bounds[3], y, height)
+
+## Tile Definitions
+
+class Border(Enum):
+    TOP = (0, -1)
+    LEFT = (-1, 0)
+    RIGHT = (1, 0)
+    BOTTOM = (0, 1)
+    
+    @staticmethod
+    def from_mask(mask):
+        return set(dir for bit, dir in enumerate(Border) if mask >> bit & 1)
+            
+    @staticmethod
+    def sheet_pos(neighbor_set):
+        x, y = 0, 0
+        if Border.LEFT in neighbor_set:
+            if Border.RIGHT in neighbor_set:
+                x = 1
+            else:
+                x = 2
+        else:
+            if Border.RIGHT in neighbor_set:
+                x = 0
+            else:
+                x = 3
+        if Border.TOP in neighbor_set:
+            if Border.BOTTOM in neighbor_set:
+                y = 1
+            else:
+                y = 2
+        else:
+            if Border.BOTTOM in neighbor_set:
+                y = 0
+            else:
+                y = 3
+        return x, y
+
+# Sheet position for each 4-bit neighbor mask, bits ordered as in Border
+border_sheet = tuple(Border.sheet_pos(Border.from_mask(mask)) for mask in range(16))
+
+def with_neighbors(cells):
+    # the cells and the ones bordering them, whose drawn borders follow them
+    near = cells.copy()
+    for dir in Border:
+        near |= np.roll(cells, dir.value[::-1], axis=(0, 1))
+    return near
+
+class Block():
+    all_blocks = dict()
+    # tile positions on the sheets, cropped on first use
+    tiles = ((0, 0),)
+    colors = ((158, 87, 21),)
+    index = 4
+    def __init__(self, offset, modifier, variant=None):
+        if variant is None:
+            variant = self.pick_variant(offset, modifier, 0, 0)
+        self.variant = variant
+        self.tile = tileAt(*self.tiles[variant])
+        self.color = self.colors[0]
+        
+    @classmethod
+    def pick_variant(cls, offset, modifier, x, y):
+        return int(cls.pick_variants(np.array([offset]), np.array([modifier]), np.array([x]), np.array([y]))[0])
+        
+    @classmethod
+    def pick_variants(cls, offsets, modifiers, xs, ys):
+        return np.zeros(len(offsets), dtype=np.uint8)
+        
+    @classmethod
+    def variant_count(cls):
+        return len(cls.tiles)
+            
+    def get_tile(self, small=False):
+        if small:
+            return self.tile[1]
+        else:
+            return self.tile[0]
+            
+    def get_color(self):
+        return self.color
+        
+    @staticmethod
+    def parse_data(data):
+        return int(data[0]), int(data[3]), int(data[4])
+        
+    @staticmethod
+    def from_data(data):
+        index, offset, modifier = Block.parse_data(data)
+        return Block.all_blocks[index](offset, modifier)
+        
+        
+class BlockBordered(Block):
+    light_color = (203, 109, 17)
+    dark_color = (125, 66, 9)
+    generated = False
+    sheets = []
+    join_any = True
+    
+    def __init__(self, offset, modifier, variant=None, mask=0):
+        super().__init__(offset, modifier, variant)
+        self.mask = mask
+        if not type(self).generated:
+            self.sheets.append(self.generate_borders(self.tile))
+            type(self).generated = True
+        self.sheet, self.sheet_small = self.sheets[0]
+            
+    def get_tile(self, small=False):
+        x, y = border_sheet[self.mask]
+        sheet = self.sheet_small if small else self.sheet
+        size = sheet.width // 4
+        return sheet.crop((x*size, y*size, (x+1)*size, (y+1)*size))
+        
+    def generate_borders(self, tile):
+        return tuple(Image.fromarray(self.bordered(np.array(image.convert("RGBA"))), "RGBA") for image in tile)
+        
+    def bordered(self, tile):
+        # the tile with every border combination (see border_sheet), for any tile size
+        size = len(tile)
+        end = 4 * size
+        sheet = np.tile(tile, (4, 4, 1))
+        light = self.light_color + (255,)
+        dark = self.dark_color + (255,)
+        # the bevel inside each edge skips the first and last pixel of every tile
+        inner = np.arange(end) % size
+        inner = (inner != 0) & (inner != size - 1)
+        # lefts go first, so tops win the top left corners and bottoms the bottom right ones
+        sheet[:, [0, 3*size]] = dark
+        sheet[np.ix_(inner, [1, 3*size + 1])] = dark
+        sheet[[0, 3*size], :] = light
+        sheet[np.ix_([1, 3*size + 1], inner)] = light
+        sheet[:, [end - 1, 3*size - 1]] = light
+        sheet[np.ix_(inner, [end - 2, 3*size - 2])] = light
+        sheet[[end - 1, 3*size - 1], :] = dark
+        sheet[np.ix_([end - 2, 3*size - 2], inner)] = dark
+        return sheet
+                
+    
+class BlockAct(Block):
+    # blue (boost)
+    tiles = ((6, 2),)
+    colors = ((0, 138, 255),)
+    index = 0
+    
+class BlockBalk(Block):
+    # d_green (anchor)
+    tiles = ((4, 2), (5, 2))
+    colors = ((173, 173, 25),)
+    index = 1
+    
+    
+class BlockCalm(Block):
+    # l_blue (ice)
+    tiles = ((0, 3),)
+    colors = ((163, 237, 255),)
+    index = 2
+    
+class BlockDeath(Block):
+    # spooky scary
+    colors = ((0, 0, 0),)
+    index = 3
+    
+class BlockDeathGhost(Block):
+    # spooky scary
+    colors = ((208, 208, 208),)
+    index = 3
+    
+class BlockDeathWandering(Block):
+    # spooky scary
+    colors = ((208, 208, 208),)
+    index = 3
+    
+class BlockDirt(Block):
+    # dirt
+    tiles = ((0, 4), (0, 5), (0, 6), (0, 7))
+    colors = ((158, 87, 21), (129, 51, 0))
+    index = 4
+    
+    def __init__(self, offset, modifier, variant=None):
+        super().__init__(offset, modifier, variant)
+        self.color = self.colors[self.variant // 2]
+        
+    @classmethod
+    def pick_variants(cls, offsets, modifiers, xs, ys):
+        return coord_hash(xs, ys) % 4
+    
+class BlockFury(Block):
+    # orange (arrow)
+    tiles = ((0, 2), (1, 2), (2, 2), (3, 2))
+    colors = ((255, 168, 0),)
+    index = 5
+              
+    @classmethod
+    def pick_variants(cls, offsets, modifiers, xs, ys):
+        # TODO: Verify modifier
+        return np.select([modifiers == 0, offsets == 2, offsets == 0], [3, 0, 1], 2)
+    
+    
+class BlockHate(Block):
+    # red (mine)
+    tiles = ((6, 1), (7, 3))
+    colors = ((237, 0, 0),)
+    index = 6           
+    
+    @classmethod
+    def pick_variants(cls, offsets, modifiers, xs, ys):
+        return np.where(offsets == 2, 0, 1)
+    
+class BlockLove(Block):
+    # pink (love)
+    tiles = ((0, 1), (1, 1), (2, 1), (3, 1))
+    colors = ((255, 85, 205),)
+    index = 7
+    
+    @classmethod
+    def pick_variants(cls, offsets, modifiers, xs, ys):
+        return coord_hash(xs, ys) % len(cls.tiles)
+    
+    
+class BlockPortal(Block):
+    # portal
+    tiles = ((4, 3), (5, 3))
+    colors = ((109, 129, 144), (255, 254, 199))
+    index = 11
+    
+    def __init__(self, offset, modifier, variant=None):
+        super().__init__(offset, modifier, variant)
+        self.color = self.colors[self.variant]
+        
+    @classmethod
+    def pick_variants(cls, offsets, modifiers, xs, ys):
+        # TODO: Correct offset
+        return np.where(offsets == 1, 0, 1)
+    
+class BlockRock(BlockBordered):
+    # structure
+    tiles = ((7, 2),)
+    colors = ((109, 129, 144),)
+    index = 10
+    light_color = (139, 164, 182)
+    dark_color = (60, 79, 94)
+    # only joins other structure tiles
+    join_any = False
+    
+class BlockVine(BlockBordered):
+    # green (garden)
+    tiles = ((1, 3),)
+    colors = ((148, 232, 16),)
+    index = 8  
+    light_color = (196, 254, 37)
+    dark_color = (119, 216, 3)
+    sheets = []
+    def __init__(self, offset, modifier, variant=None, mask=0):
+        if BlockVine.generated == False:
+            for i in range(8):
+                rotate = (i % 4) * 90
+                flip = i // 4
+                tile = list(tileAt(*self.tiles[0]))
+                if flip:
+                    tile[0] = tile[0].transpose(Image.FLIP_LEFT_RIGHT)
+                    tile[1] = tile[1].transpose(Image.FLIP_LEFT_RIGHT)
+                tile[0] = tile[0].rotate(rotate)
+                tile[1] = tile[1].rotate(rotate)
+                self.sheets.append(self.generate_borders(tile))
+            BlockVine.generated = True
+        if variant is None:
+            variant = self.pick_variant(offset, modifier, 0, 0)
+        super().__init__(offset, modifier, 0, mask)
+        self.variant = variant
+        self.sheet, self.sheet_small = self.sheets[variant]
+        
+    @classmethod
+    def pick_variants(cls, offsets, modifiers, xs, ys):
+        return coord_hash(xs, ys) % 8
+        
+    @classmethod
+    def variant_count(cls):
+        return 8
+    
+    
+class BlockVoid(Block):
+    # void
+    pass
+    
+class BlockWill(Block):
+    # purple (pylon)
+    tiles = ((4, 1), (5, 1))
+    colors = ((153, 98, 223),)
+    index = 9
+    
+    @classmethod
+    def pick_variants(cls, offsets, modifiers, xs, ys):
+        return coord_hash(xs, ys) % len(cls.tiles)
+
+## SP Block Dictionaries
+
+Block.all_blocks[BlockAct.index] = BlockAct
+Block.all_blocks[BlockBalk.index] = BlockBalk
+Block.all_blocks[BlockCalm.index] = BlockCalm
+Block.all_blocks[BlockDeath.index] = BlockDeath
+Block.all_blocks[BlockDirt.index] = BlockDirt
+Block.all_blocks[BlockFury.index] = BlockFury
+Block.all_blocks[BlockHate.index] = BlockHate
+Block.all_blocks[BlockLove.index] = BlockLove
+Block.all_blocks[BlockPortal.index] = BlockPortal
+Block.all_blocks[BlockRock.index] = BlockRock
+Block.all_blocks[BlockVine.index] = BlockVine
+Block.all_blocks[BlockWill.index] = BlockWill
+            
+## Board Sorting
+
+EMPTY = 255
+
+SORT_NONE = 0
+SORT_GATEWAY = 1
+SORT_STRUCT = 2
+SORT_USER = 3
+
+sort_table = np.full(256, SORT_USER, dtype=np.uint8)
+sort_table[EMPTY] = SORT_NONE
+sort_table[BlockDirt.index] = SORT_NONE
+sort_table[BlockPortal.index] = SORT_GATEWAY
+sort_table[BlockRock.index] = SORT_STRUCT
+            
+## Visibility Field
+
+class VisibilityField():
+    # Summed-area table over a 2x2 tiling of the user grid. Any wrapped box
+    # around every cell, at any radius, is then a few table lookups.
+    def __init__(self, user):
+        self.size = user.shape[0]
+        self.table = np.zeros((2*self.size + 1, 2*self.size + 1), dtype=np.int32)
+        self.table[1:, 1:] = np.tile(user.astype(np.int32), (2, 2)).cumsum(0).cumsum(1)
+        
+    def area(self, top, bottom, left, right):
+        table = self.table
+        return table[bottom, right] - table[top, right] - table[bottom, left] + table[top, left]
+        
+    def box(self, radius):
+        n = self.size
+        if radius < 0:
+            return np.zeros((n, n), dtype=np.int32)
+        wraps, rest = divmod(2*radius + 1, n)
+        start = (np.arange(n) - radius) % n
+        rows, cols = start[:, None], start[None, :]
+        partial = self.area(rows, rows + rest, cols, cols + rest)
+        row_strip = self.area(rows, rows + rest, 0, n)
+        col_strip = self.area(0, n, cols, cols + rest)
+        return wraps*wraps*self.table[n, n] + wraps*(row_strip + col_strip) + partial
+        
+    def ring(self, radius):
+        # user blocks exactly on the perimeter at this radius
+        return self.box(radius) > self.box(radius - 1)
+        
+    def added(self, x, y, amount):
+        # a copy with one user block more (or fewer) at (x, y), in all four tiled copies
+        field = VisibilityField.__new__(VisibilityField)
+        field.size = self.size
+        field.table = self.table.copy()
+        for top in (y + 1, y + 1 + self.size):
+            for left in (x + 1, x + 1 + self.size):
+                field.table[top:, left:] += amount
+        return field
+        
+    def nearest(self, mask):
+        # Chebyshev distance from each masked cell to its nearest user block, -1 without any
+        distance = np.full((self.size, self.size), -1, dtype=np.int32)
+        if self.table[self.size, self.size] == 0:
+            return distance
+        pending = mask.copy()
+        radius = 0
+        while pending.any():
+            found = pending & (self.box(radius) > 0)
+            distance[found] = radius
+            pending &= ~found
+            radius += 1
+        return distance
+        
+    def island_sight(self, labels, count, radii):
+        sight = dict()
+        for radius in radii:
+            hits = np.bincount(labels.ravel(), weights=self.ring(radius).ravel(), minlength=count + 1)
+            sight[radius] = hits > 0
+        return sight
+
+## Render Threads
+#
+# numpy copies and PIL encoders release the GIL, so large composites are
+# split into bands of rows and finished images are encoded side by side.
+
+render_threads = os.cpu_count() or 1
+band_bytes = 4 << 20
+thread_pool = None
+
+def get_pool():
+    global thread_pool
+    if thread_pool is None:
+        thread_pool = ThreadPoolExecutor(max_workers=render_threads)
+    return thread_pool
+    
+def set_threads(count):
+    global render_threads, thread_pool
+    if thread_pool is not None:
+        thread_pool.shutdown()
+        thread_pool = None
+    render_threads = max(1, count)
+    
+def banded(work, rows, nbytes):
+    # call work with slices of rows a few MB each, across the pool when there is more than one
+    count = max(1, min(rows, nbytes // band_bytes))
+    bands = [slice(band * rows // count, (band + 1) * rows // count) for band in range(count)]
+    if render_threads > 1 and count > 1:
+        list(get_pool().map(work, bands))
+    else:
+        for band in bands:
+            work(band)
+
+## Tile Atlas
+
+render_modes = ("pixel", "small", "original")
+tile_sizes = {"pixel": 1, "small": 12, "original": 24}
+
+class TileAtlas():
+    # Every drawable (type, variant, mask) combination packed into one array
+    # per tile size, so a whole board can be composited with a single gather.
+    def __init__(self, large, small, colors, lookup):
+        self.large = large
+        self.small = small
+        self.colors = colors
+        self.lookup = lookup
+        self.reductions = dict()
+        self.palettes = dict()
+        
+    @staticmethod
+    def build():
+        white = ImageColor.colormap["white"]
+        large = [np.array(Image.new("RGBA", (24, 24), white))]
+        small = [np.array(Image.new("RGBA", (12, 12), white))]
+        colors = [ImageColor.getrgb(white) + (255,)]
+        lookup = np.zeros((256, 8, 16), dtype=np.uint16)
+        for index, block_type in Block.all_blocks.items():
+            bordered = issubclass(block_type, BlockBordered)
+            for variant in range(block_type.variant_count()):
+                for mask in range(16 if bordered else 1):
+                    if bordered:
+                        block = block_type(0, 0, variant, mask)
+                        lookup[index, variant, mask] = len(large)
+                    else:
+                        block = block_type(0, 0, variant)
+                        lookup[index, variant, :] = len(large)
+                    large.append(np.array(block.get_tile(small=False).convert("RGBA")))
+                    small.append(np.array(block.get_tile(small=True).convert("RGBA")))
+                    colors.append(tuple(block.get_color()) + (255,))
+        return TileAtlas(np.stack(large), np.stack(small), np.array(colors, dtype=np.uint8), lookup)
+        
+    @staticmethod
+    def load(path):
+        with np.load(path) as data:
+            return TileAtlas(data["large"], data["small"], data["colors"], data["lookup"])
+            
+    def dump(self, path):
+        # concurrent workers never read a partial file
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_atomic(path, lambda output: np.savez_compressed(output, large=self.large, small=self.small, colors=self.colors, lookup=self.lookup))
+        
+    def render(self, indices, mode, size=None):
+        # indexed whenever the mode's tiles fit a palette and are kept or
+        # repeated in whole pixels, RGBA otherwise
+        native = self.sheet(mode).shape[1]
+        size = size or native
+        profile.count("tiles drawn", indices.size)
+        if size % native == 0 and self.indexed(mode) is not None:
+            sheet, palette, transparency = self.indexed(mode)
+            if size != native:
+                sheet = sheet.repeat(size // native, axis=1).repeat(size // native, axis=2)
+            return paletted(self.composite(indices, sheet), palette, transparency)
+        return Image.fromarray(self.composite(indices, self.sized(mode, size)), "RGBA")
+        
+    def indexed(self, mode):
+        # The mode's tiles as palette indices. Needs at most 256 colors, and
+        # at most one of them may be see-through (fully transparent).
+        if mode not in self.palettes:
+            sheet = self.sheet(mode)
+            colors, inverse = np.unique(sheet.reshape(-1, 4), axis=0, return_inverse=True)
+            clear = np.flatnonzero(colors[:, 3] != 255)
+            if len(colors) > 256 or len(clear) > 1 or (colors[clear, 3] != 0).any():
+                self.palettes[mode] = None
+            else:
+                indexed = inverse.reshape(sheet.shape[:3]).astype(np.uint8)
+                transparency = int(clear[0]) if len(clear) else None
+                self.palettes[mode] = indexed, colors[:, :3].ravel().tolist(), transparency
+        return self.palettes[mode]
+        
+    def render_scaled(self, indices, mode, scale):
+        # The pixels scale_image makes of the native render, so cached and
+        # fresh renders agree. Whole tile sizes and every scale up are
+        # composited straight at the output size; only fractional tile
+        # sizes going down resample the native render.
+        size = self.sheet(mode).shape[1] * scale
+        if abs(size - round(size)) < 1e-6:
+            return self.render(indices, mode, round(size))
+        if scale > 1:
+            return self.render_nearest(indices, mode, scale)
+        return scale_image(self.render(indices, mode), scale)
+        
+    def render_nearest(self, indices, mode, scale):
+        # every output pixel taken from the tile pixel under it, tile edges landing on whole pixels
+        native = self.sheet(mode).shape[1]
+        height, width = indices.shape
+        rows = nearest_index(height*native, max(1, round(height*native*scale)))
+        cols = nearest_index(width*native, max(1, round(width*native*scale)))
+        profile.count("tiles drawn", indices.size)
+        indexed = self.indexed(mode)
+        sheet = self.sheet(mode) if indexed is None else indexed[0]
+        output = np.empty((len(rows), len(cols)) + sheet.shape[3:], dtype=sheet.dtype)
+        def band(part):
+            ys = rows[part]
+            output[part] = sheet[indices[ys // native][:, cols // native], (ys % native)[:, None], (cols % native)[None, :]]
+        banded(band, len(rows), output.nbytes)
+        if indexed is None:
+            return Image.fromarray(output, "RGBA")
+        return paletted(output, *indexed[1:])
+        
+    def sheet(self, mode):
+        if mode == "pixel":
+            return self.colors[:, None, None, :]
+        return self.small if mode == "small" else self.large
+        
+    def composite(self, indices, tiles):
+        # tile rows are gathered straight into place, band by band
+        height, width = indices.shape
+        size = tiles.shape[1]
+        channels = tiles.shape[3:]
+        output = np.empty((height, size, width, size) + channels, dtype=tiles.dtype)
+        def band(rows):
+            output[rows] = tiles[indices[rows]].swapaxes(1, 2)
+        banded(band, height, output.nbytes)
+        return output.reshape(height*size, width*size, *channels)
+        
+    def sized(self, mode, size=None):
+        # A mode's tiles at another size, made once per size. Whole multiples
+        # repeat pixels and whole fractions are box-filtered. Other sizes are
+        # resampled tile by tile, nearest up and box down.
+        sheet = self.sheet(mode)
+        count, native = sheet.shape[:2]
+        if size is None or size == native:
+            return sheet
+        if size <= 0:
+            raise ValueError("tile size must be positive, not %dpx" % size)
+        if (mode, size) not in self.reductions:
+            if size % native == 0:
+                factor = size // native
+                sized = sheet.repeat(factor, axis=1).repeat(factor, axis=2)
+            elif native % size == 0:
+                factor = native // size
+                blocks = sheet.reshape(count, size, factor, size, factor, 4)
+                sized = blocks.mean(axis=(2, 4)).round().astype(np.uint8)
+            elif size > native:
+                index = nearest_index(native, size)
+                sized = sheet[:, index[:, None], index[None, :]]
+            else:
+                sized = np.stack([np.array(Image.fromarray(tile, "RGBA").resize((size, size), Image.BOX)) for tile in sheet])
+            self.reductions[mode, size] = sized
+        return self.reductions[mode, size]
+
+# bump when generated tiles change, to invalidate cached atlases
+atlas_version = 2
+atlas = None
+# what a missing, damaged or outdated .npz raises when read
+npz_errors = (OSError, EOFError, KeyError, ValueError, zipfile.BadZipFile, zlib.error)
+
+def get_atlas():
+    global atlas
+    if atlas is None:
+        path = os.path.join(cache_dir(), "atlas-%s.npz" % tileset_hash())
+        try:
+            atlas = TileAtlas.load(path)
+        except npz_errors:
+            atlas = TileAtlas.build()
+            try:
+                atlas.dump(path)
+            except OSError:
+                pass
+    return atlas
+            
+## Image Output
+
+output_formats = ("png", "webp")
+
+def nearest_index(size, scaled):
+    # the pixel under the centre of each of scaled pixels spread over size
+    return (2 * np.arange(scaled) + 1) * size // (2 * scaled)
+    
+def paletted(pixels, palette, transparency):
+    image = Image.fromarray(pixels, "P")
+    image.putpalette(palette)
+    if transparency is not None:
+        image.info["transparency"] = transparency
+    return image
+    
+def scale_image(image, scale):
+    # Nearest neighbour up keeps the pixel art crisp, box filtering down keeps
+    # thumbnails smooth. TileAtlas.render_scaled makes the same pixels from tiles.
+    if scale == 1:
+        return image
+    width, height = image.size
+    size = (max(1, round(width*scale)), max(1, round(height*scale)))
+    if scale > 1:
+        pixels = np.asarray(image)[nearest_index(height, size[1])[:, None], nearest_index(width, size[0])]
+        if image.mode == "P":
+            return paletted(pixels, image.getpalette(), image.info.get("transparency"))
+        return Image.fromarray(pixels, image.mode)
+    # palette images only resample with nearest neighbour
+    image = image.convert("RGBA")
+    factor = round(1 / scale)
+    if abs(1 / scale - factor) < 1e-6 and width % factor == 0 and height % factor == 0:
+        # whole fractions average blocks the way TileAtlas.sized does
+        blocks = np.asarray(image).reshape(size[1], factor, size[0], factor, 4)
+        return Image.fromarray(blocks.mean(axis=(1, 3)).round().astype(np.uint8), "RGBA")
+    return image.resize(size, Image.BOX)
+    
+def save_image(image, path, compression=6, format=None):
+    # the format follows the path's extension unless given, as it must be for file objects
+    format = (format or os.path.splitext(path)[1].lstrip(".")).lower()
+    if format not in output_formats:
+        raise ValueError("cannot write %s images, only %s" % (format or "unnamed", " or ".join(output_formats)))
+    with profile.phase("output"):
+        if format == "webp":
+            # lossless WebP effort runs 0-6 where PNG levels run 0-9
+            image.save(path, "WEBP", lossless=True, method=round(compression * 6 / 9))
+        else:
+            image.save(path, "PNG", compress_level=compression)
+
+## Board Offsets
+
+offset_modes = ("gaps", "cluster", "islands")
+
+def circular_gaps(written):
+    # starts and lengths of the runs of unwritten positions on a ring, by start
+    size = len(written)
+    if not written.any():
+        return np.array([0]), np.array([size])
+    first = int(np.argmax(written))
+    empty = ~np.roll(written, -first)
+    starts = np.flatnonzero(empty & ~np.roll(empty, 1))
+    ends = np.flatnonzero(empty & ~np.roll(empty, -1))
+    order = np.argsort((starts + first) % size, kind="stable")
+    return ((starts + first) % size)[order], (ends - starts + 1)[order]
+    
+def gap_center(written):
+    # middle of the longest empty run, the first one on ties; None if there is no gap
+    starts, lengths = circular_gaps(written)
+    if not len(starts):
+        return None
+    best = np.argmax(lengths)
+    return int(starts[best] + lengths[best] // 2) % len(written)
+    
+def seam_cuts(labels, shown, axis):
+    # For every seam position, how many shown islands it would split. A seam
+    # at p falls between p-1 and p, so it is clear of an island when either
+    # side lies in the island's largest gap.
+    size = shown.shape[0]
+    cells = shown & (labels > 0)
+    visible, inverse = np.unique(labels[cells], return_inverse=True)
+    occupied = np.zeros((len(visible), size), dtype=bool)
+    occupied[inverse, np.nonzero(cells)[1 - axis]] = True
+    cuts = np.full(size + 1, len(visible))
+    for written in occupied:
+        starts, lengths = circular_gaps(written)
+        if not len(starts):
+            # wraps all the way round, so every seam splits it
+            continue
+        best = np.argmax(lengths)
+        start, stop = starts[best], starts[best] + lengths[best] + 1
+        cuts[start:min(stop, size)] -= 1
+        if stop > size:
+            cuts[:stop - size] -= 1
+    return cuts[:size]
+    
+def seam_offset(written, cuts=None):
+    # Offset that draws the seam first: through the fewest islands, then
+    # nearest the middle of the longest empty run.
+    size = len(written)
+    center = gap_center(written)
+    if cuts is None:
+        return 0 if center is None else (size - center) % size
+    positions = np.arange(size)
+    distance = np.abs(positions - (center or 0))
+    distance = np.minimum(distance, size - distance)
+    best = np.lexsort((distance, cuts))[0]
+    return int(size - positions[best]) % size
+    
+def find_offset(shown, mode="gaps", labels=None):
+    # Offset that puts the wrap seam through empty space. "cluster" centers
+    # the largest group of touching tiles instead, and "islands" splits as
+    # few islands as it can, labelled by `labels` or by their shown tiles.
+    if mode not in offset_modes:
+        raise ValueError("unknown offset mode %r" % mode)
+    if not shown.any():
+        return 0, 0
+    if mode == "cluster":
+        clusters, count = label_torus(shown, reach=1)
+        largest = clusters == np.argmax(np.bincount(clusters[clusters > 0]))
+        # centered means the seam sits opposite it, in the middle of its own largest gap
+        offset = []
+        for axis in (0, 1):
+            written = largest.any(axis=axis)
+            offset.append(seam_offset(shown.any(axis=axis) if written.all() else written))
+        return tuple(offset)
+    if mode == "islands":
+        if labels is None:
+            labels = label_torus(shown)[0]
+        return tuple(seam_offset(shown.any(axis=axis), seam_cuts(labels, shown, axis)) for axis in (0, 1))
+    return tuple(seam_offset(shown.any(axis=axis)) for axis in (0, 1))
+
+## Board Snapshots
+#
+# A snapshot is a parsed board with its visibility already applied, laid out
+# so the grids can be mapped straight from the file:
+#   header: magic, version, board size, marked radius, island count
+#   uint8 grids, size x size each: types, variants, offsets, modifiers, shown
+#   int32 island labels, size x size, of the fully visible board
+#   int32 island table, count x 6: gateway x and y (-1 without one), then x, y, width, height
+# Sections start on 8 byte boundaries.
+
+snapshot_magic = b"SPSNAP"
+snapshot_version = 2
+snapshot_header = struct.Struct("<6sHHhI")
+snapshot_grids = ("types", "variants", "offsets", "modifiers", "shown")
+
+def snapshot_layout(size, count):
+    # byte offsets of every section, and the total file size
+    layout = dict()
+    position = snapshot_header.size
+    for name, nbytes in [(name, size * size) for name in snapshot_grids] + [("labels", size * size * 4), ("islands", count * 24)]:
+        position = -(-position // 8) * 8
+        layout[name] = position
+        position += nbytes
+    return layout, position
+
+def is_snapshot(path):
+    with open(path, "rb") as file:
+        return file.read(len(snapshot_magic)) == snapshot_magic
+
+## SPBoard Class
+
+class SPBoard():
+    def __init__(self, size, scale=1, border=False, auto_offset=False, offset=(0, 0), visible=-1, offset_mode="gaps"):
+        self.view_size = size * (2 if border else 1)
+        self.size = size
+        self.scale = scale
+        self.border = border
+        self.auto_offset = auto_offset
+        self.offset_mode = offset_mode
+        self.offset = offset
+        self.visible = visible
+        self.images = dict()
+        self.prepared = False
+        self.applied_offset = (0, 0)
+        # the radius the shown grid was last marked for, -1 when all is shown
+        self.marked = -1
+        # Board state is kept as size x size grids indexed [y, x]; Block
+        # objects are only built on demand by block_at.
+        self.types = np.full((size, size), EMPTY, dtype=np.uint8)
+        self.variants = np.zeros((size, size), dtype=np.uint8)
+        self.offsets = np.zeros((size, size), dtype=np.uint8)
+        self.modifiers = np.zeros((size, size), dtype=np.uint8)
+        self.sort = np.zeros((size, size), dtype=np.uint8)
+        self.shown = np.zeros((size, size), dtype=bool)
+        self.masks = None
+        self.field = None
+        
+    @property
+    def gateways(self):
+        return (self.sort == SORT_GATEWAY) & self.shown
+        
+    @property
+    def structs(self):
+        return (self.sort == SORT_STRUCT) & self.shown
+        
+    @property
+    def user(self):
+        return (self.sort == SORT_USER) & self.shown
+        
+    @property
+    def hidden(self):
+        return (self.types != EMPTY) & ~self.shown
+        
+    def place(self, x, y, index, offset=0, modifier=0, variant=None):
+        # returns the cells whose drawn tile may have changed, see edit
+        x = x % self.size
+        y = y % self.size
+        if variant is None:
+            variant = Block.all_blocks[index].pick_variant(offset, modifier, x, y)
+        return self.edit(x, y, index, offset, modifier, variant)
+        
+    def remove(self, x, y):
+        return self.edit(x % self.size, y % self.size, EMPTY, 0, 0, 0)
+        
+    def move(self, x, y, to_x, to_y):
+        # the tile keeps its offset and modifier, its variant follows the new cell
+        x, y = x % self.size, y % self.size
+        if self.types[y, x] == EMPTY:
+            return np.zeros((self.size, self.size), dtype=bool)
+        index, offset, modifier = int(self.types[y, x]), int(self.offsets[y, x]), int(self.modifiers[y, x])
+        return self.remove(x, y) | self.place(to_x, to_y, index, offset, modifier)
+        
+    def edit(self, x, y, index, offset, modifier, variant):
+        # Change one cell. Once visibility has been worked out, it is kept up
+        # to date here: islands are relabelled only for structural edits, and
+        # only islands near the cell are checked again. Returns the cells
+        # whose drawn tile may have changed, neighbors included.
+        was = self.sort[y, x]
+        self.types[y, x] = index
+        self.variants[y, x] = variant
+        self.offsets[y, x] = offset
+        self.modifiers[y, x] = modifier
+        self.add_to_sort(x, y, index)
+        self.masks = None
+        shown = self.shown.copy()
+        if self.field is None or self.marked is None:
+            # nothing to keep up to date yet
+            self.shown[y, x] = index != EMPTY
+            self.marked = None
+            self.field = None
+        else:
+            now = self.sort[y, x]
+            labels, islands, field = self.field
+            if (was == SORT_USER) != (now == SORT_USER):
+                field = field.added(x, y, 1 if now == SORT_USER else -1)
+            if {was, now} & {SORT_STRUCT, SORT_GATEWAY}:
+                labels, islands = self.relabel_near(x, y, labels, islands)
+            if self.field[2] is not field or self.field[1] is not islands:
+                for island in islands:
+                    island.distance = None
+            self.field = labels, islands, field
+            if self.marked > 0:
+                distance = self.chebyshev(x, y)
+                touched = distance <= 2
+                if (was == SORT_USER) != (now == SORT_USER):
+                    touched |= distance == self.marked
+                self.resight(self.marked, touched, shown)
+            else:
+                self.set_all_visible()
+        dirty = shown != self.shown
+        dirty[y, x] = True
+        return with_neighbors(dirty)
+        
+    def relabel_near(self, x, y, labels, islands):
+        # Only islands with a tile within reach of (x, y) can be joined, split
+        # or gain a gateway, so just their tiles are grouped again. Labels stay
+        # numbered 1..count by moving the last islands into freed labels.
+        labels = labels.copy()
+        islands = list(islands)
+        near = {int(labels[(y + j) % self.size, (x + i) % self.size]) for i, j in window(2)} - {0}
+        cells = set()
+        for label in near:
+            cells.update(map(tuple, islands[label - 1].cells.tolist()))
+            labels[islands[label - 1].cells[:, 1], islands[label - 1].cells[:, 0]] = 0
+        if self.sort[y, x] == SORT_STRUCT:
+            cells.add((x, y))
+        else:
+            cells.discard((x, y))
+        free = sorted(near)
+        for group in self.groups(cells):
+            label = free.pop(0) if free else len(islands) + 1
+            group = np.array(sorted(group, key=lambda cell: (cell[1], cell[0])))
+            labels[group[:, 1], group[:, 0]] = label
+            island = Island(label, group, self.first_gateway(group), self.bounds(group))
+            if label > len(islands):
+                islands.append(island)
+            else:
+                islands[label - 1] = island
+        for label in reversed(free):
+            last = islands.pop()
+            if last.label != label:
+                labels[last.cells[:, 1], last.cells[:, 0]] = label
+                islands[label - 1] = moved = Island(label, last.cells, last.gateway, last.bounds)
+                moved.sprites = last.sprites
+        return labels, islands
+        
+    def groups(self, cells):
+        # cells joined within two tiles of each other, as label_torus joins them
+        remaining = set(cells)
+        groups = []
+        while remaining:
+            stack = [remaining.pop()]
+            group = []
+            while stack:
+                cx, cy = stack.pop()
+                group.append((cx, cy))
+                for i, j in window(2):
+                    cell = ((cx + i) % self.size, (cy + j) % self.size)
+                    if cell in remaining:
+                        remaining.remove(cell)
+                        stack.append(cell)
+            groups.append(group)
+        return groups
+        
+    def first_gateway(self, cells):
+        # first gateway (row-major) within the 5x5 surround of the cells
+        near = np.zeros((self.size, self.size), dtype=bool)
+        for i, j in window(2):
+            near[(cells[:, 1] + j) % self.size, (cells[:, 0] + i) % self.size] = True
+        gy, gx = np.nonzero(near & (self.sort == SORT_GATEWAY))
+        return (int(gx[0]), int(gy[0])) if len(gy) else None
+        
+    def bounds(self, cells):
+        x, width = wrapped_bounds(cells[:, 0], self.size)
+        y, height = wrapped_bounds(cells[:, 1], self.size)
+        return x, y, width, height
+        
+    def chebyshev(self, x, y):
+        # wrapped king's move distance from (x, y) to every cell
+        xs = np.abs(np.arange(self.size) - x)
+        ys = np.abs(np.arange(self.size) - y)
+        xs = np.minimum(xs, self.size - xs)
+        ys = np.minimum(ys, self.size - ys)
+        return np.maximum(ys[:, None], xs[None, :])
+        
+    def place_tiles(self, xs, ys, types, offsets, modifiers):
+        # bulk place, later tiles winning over earlier ones on the same cell
+        xs = np.asarray(xs) % self.size
+        ys = np.asarray(ys) % self.size
+        cells = ys * self.size + xs
+        order = len(cells) - 1 - np.unique(cells[::-1], return_index=True)[1]
+        xs, ys, types = xs[order], ys[order], np.asarray(types)[order]
+        offsets, modifiers = np.asarray(offsets)[order], np.asarray(modifiers)[order]
+        variants = np.zeros(len(order), dtype=np.uint8)
+        with profile.phase("variants"):
+            for index in np.unique(types).tolist():
+                same = types == index
+                variants[same] = Block.all_blocks[index].pick_variants(offsets[same], modifiers[same], xs[same], ys[same])
+        self.types[ys, xs] = types
+        self.variants[ys, xs] = variants
+        self.offsets[ys, xs] = offsets
+        self.modifiers[ys, xs] = modifiers
+        self.shown[ys, xs] = True
+        self.sort[ys, xs] = sort_table[types]
+        self.marked = None
+        self.masks = None
+        self.field = None
+        
+    def block_at(self, x, y):
+        index = self.types[y, x]
+        if index == EMPTY:
+            return None
+        block_type = Block.all_blocks[index]
+        if issubclass(block_type, BlockBordered):
+            return block_type(self.offsets[y, x], self.modifiers[y, x], self.variants[y, x], self.neighbor_masks()[y, x])
+        return block_type(self.offsets[y, x], self.modifiers[y, x], self.variants[y, x])
+        
+    def neighbor_masks(self):
+        if self.masks is None:
+            self.masks = self.compute_masks()
+        return self.masks
+        
+    def compute_masks(self, shown=None):
+        # 4-bit adjacency per bordered tile, one toroidal roll per direction
+        shown = self.shown if shown is None else shown
+        rocks = shown & (self.types == BlockRock.index)
+        masks = np.zeros((self.size, self.size), dtype=np.uint8)
+        for block_type in (BlockRock, BlockVine):
+            cells = shown & (self.types == block_type.index)
+            near = shown if block_type.join_any else rocks
+            if profile.enabled:
+                profile.count("mask cells", np.count_nonzero(cells))
+            for bit, dir in enumerate(Border):
+                rolled = np.roll(near, (-dir.value[1], -dir.value[0]), axis=(0, 1))
+                masks[cells & rolled] |= 1 << bit
+        return masks
+    
+    def show(self, x, y):
+        if self.types[y, x] != EMPTY:
+            self.shown[y, x] = True
+            self.masks = None
+            
+    def add_to_sort(self, x, y, index):
+        self.sort[y, x] = sort_table[index]
+        
+    def hide(self, x, y):
+        self.shown[y, x] = False
+        self.masks = None
+            
+    def set_all_visible(self):
+        self.shown = self.types != EMPTY
+        self.masks = None
+            
+    def shift(self, xoffset, yoffset):
+        # wrap already rendered images further, without compositing them again
+        if (xoffset, yoffset) == (0, 0) or not self.prepared:
+            return
+        with profile.phase("shift"):
+            for mode, image in self.images.items():
+                scale = tile_sizes[mode]
+                self.images[mode] = ImageChops.offset(image, xoffset*scale, yoffset*scale)
+        self.applied_offset = (self.applied_offset[0] + xoffset, self.applied_offset[1] + yoffset)
+        
+    def set_offset(self, xoffset, yoffset):
+        self.auto_offset = False
+        self.offset = (xoffset, yoffset)
+        if self.prepared:
+            self.shift(xoffset - self.applied_offset[0], yoffset - self.applied_offset[1])
+            
+    def invalidate(self):
+        self.images = dict()
+        self.prepared = False
+        
+    def prepare(self):
+        # visibility and offset shared by every output until invalidated
+        if self.prepared:
+            return
+        self.mark()
+        if self.auto_offset:
+            with profile.phase("find_offset"):
+                self.applied_offset = self.find_offset()
+        else:
+            self.applied_offset = tuple(self.offset)
+        self.prepared = True
+            
+    def mark(self):
+        # hide what the radius cannot see, unless the shown grid is already marked for it
+        radius = self.visible if self.visible > 0 else -1
+        if self.marked != radius:
+            with profile.phase("mark_unseen"):
+                if radius > 0:
+                    self.mark_unseen(radius)
+                else:
+                    self.set_all_visible()
+            self.marked = radius
+            
+    def set_radius(self, radius):
+        # Mark again for another radius. Rendered images are kept: islands
+        # that appear or vanish are pasted from or cut out with their
+        # sprites, and only the tiles around them are drawn again.
+        self.visible = radius
+        if not self.prepared:
+            return
+        shown = self.shown
+        self.mark()
+        changed = shown != self.shown
+        offset = tuple(self.find_offset()) if self.auto_offset else self.applied_offset
+        if offset != self.applied_offset:
+            # every pixel moves with the seam, so compositing again beats shifting and patching
+            self.images = dict()
+            self.applied_offset = offset
+        elif self.images and changed.any():
+            self.repaint(changed)
+            
+    def repaint(self, changed):
+        tiles = get_atlas()
+        labels, islands, field = self.visibility_field()
+        flipped = [islands[label - 1] for label in np.unique(labels[changed & (labels > 0)]).tolist()]
+        self.island_sprites(flipped, tiles)
+        with profile.phase("repaint"):
+            for mode in list(self.images):
+                # copied first, so images handed out earlier stay as they were
+                image = self.images[mode] = self.images[mode].copy()
+                scale = tile_sizes[mode]
+                for island in flipped:
+                    sprite, mask = island.sprites[mode]
+                    x, y = island.cells[0]
+                    if not self.shown[y, x]:
+                        sprite = tiles.render(np.zeros((island.bounds[3], island.bounds[2]), dtype=np.intp), mode)
+                    for left, top in self.view_positions(*island.bounds):
+                        image.paste(sprite, (left*scale, top*scale), mask)
+                        profile.count("pastes")
+        # gateways, and vines joined to the islands, go tile by tile
+        near = with_neighbors(changed)
+        vines = self.shown & (self.types == BlockVine.index)
+        self.redraw((changed | (near & vines)) & (labels == 0))
+        
+    def island_sprites(self, islands, tiles):
+        # each island's own tiles over its bounds, as drawn with the whole board shown
+        missing = [island for island in islands if any(mode not in island.sprites for mode in self.images)]
+        if not missing:
+            return
+        labels = self.visibility_field()[0]
+        masks = self.compute_masks(self.types != EMPTY)
+        for island in missing:
+            x, y, width, height = island.bounds
+            window = np.ix_((y + np.arange(height)) % self.size, (x + np.arange(width)) % self.size)
+            member = labels[window] == island.label
+            indices = tiles.lookup[self.types[window], self.variants[window], masks[window]]
+            indices[~member] = 0
+            for mode in self.images:
+                scale = tile_sizes[mode]
+                mask = (member * np.uint8(255)).repeat(scale, axis=0).repeat(scale, axis=1)
+                island.sprites[mode] = tiles.render(indices, mode), Image.fromarray(mask, "L")
+                
+    def view_positions(self, x, y, width=1, height=1):
+        # top left view tile of every drawn copy of a board box, counting copies hanging off the top or left
+        half = self.size // 2 if self.border else 0
+        left = (x + self.applied_offset[0] + half) % self.size
+        top = (y + self.applied_offset[1] + half) % self.size
+        copies = range(-1, self.view_size // self.size)
+        lefts = [left + i*self.size for i in copies if left + i*self.size + width > 0 and left + i*self.size < self.view_size]
+        tops = [top + j*self.size for j in copies if top + j*self.size + height > 0 and top + j*self.size < self.view_size]
+        return [(left, top) for left in lefts for top in tops]
+        
+    def render(self, modes=render_modes):
+        # only the requested modes are composited
+        self.prepare()
+        with profile.phase("render"):
+            tiles = get_atlas()
+            indices = self.tile_indices(tiles, self.applied_offset)
+            for mode in modes:
+                self.images[mode] = tiles.render(indices, mode)
+    
+    def tile_indices(self, tiles, offset=(0, 0)):
+        indices = tiles.lookup[self.types, self.variants, self.neighbor_masks()]
+        indices[~self.shown] = 0
+        return self.view_grid(indices, offset)
+        
+    def view_grid(self, grid, offset=(0, 0)):
+        # lay a board grid out as drawn: border copies, then the view offset
+        if self.border:
+            # the four copies at (+-size/2, +-size/2) are a 2x2 tiling shifted by half a board
+            half = self.size // 2
+            grid = np.tile(grid, (2, 2))
+            offset = (offset[0] + half, offset[1] + half)
+        # the view offset is applied to tile coordinates, before compositing
+        return np.roll(grid, (offset[1], offset[0]), axis=(0, 1))
+        
+    def render_region(self, x, y, width, height, mode="original", size=None):
+        # Composite only a window of the wrapped board, in board coordinates,
+        # at the mode's tile size or any other whole number of pixels.
+        self.prepare()
+        tiles = get_atlas()
+        rows = (y + np.arange(height)) % self.size
+        cols = (x + np.arange(width)) % self.size
+        window = np.ix_(rows, cols)
+        indices = tiles.lookup[self.types[window], self.variants[window], self.neighbor_masks()[window]]
+        indices[~self.shown[window]] = 0
+        return tiles.render(indices, mode, size)
+        
+    def redraw(self, dirty):
+        # repaint only the given board cells in every rendered image
+        for mode, image in self.images.items():
+            self.draw_cells(image, dirty, mode, tile_sizes[mode])
+            
+    def draw_cells(self, image, dirty, mode, size):
+        # repaint the given board cells of an image composited at size pixels per tile
+        with profile.phase("redraw"):
+            tiles = get_atlas()
+            indices = self.tile_indices(tiles, self.applied_offset)
+            for cy, cx in zip(*np.nonzero(self.view_grid(dirty, self.applied_offset))):
+                image.paste(tiles.render(indices[cy:cy+1, cx:cx+1], mode, size), (int(cx)*size, int(cy)*size))
+                profile.count("pastes")
+    
+    def export_pyramid(self, path, tile_size=256, format="png", compression=6):
+        # Deep Zoom pyramid of the 24px render, written one output tile at a
+        # time so memory follows the tile size rather than the map size.
+        self.prepare()
+        tiles = get_atlas()
+        indices = self.tile_indices(tiles, self.applied_offset)
+        root = os.path.splitext(path)[0]
+        width = self.view_size * 24
+        top = int(np.ceil(np.log2(width)))
+        for level in range(top, -1, -1):
+            factor = 1 << (top - level)
+            size = -(-width // factor)
+            folder = os.path.join(root + "_files", str(level))
+            os.makedirs(folder, exist_ok=True)
+            if 24 % factor == 0 and 24 // factor >= 3:
+                sheet, block, image = tiles.sized("original", 24 // factor), 24 // factor, None
+            else:
+                # below 3px a block is just its pixel color; palette images would only resize with nearest neighbour
+                image = tiles.render(indices, "pixel").convert("RGBA").resize((size, size), Image.BOX)
+            for top_edge in range(0, size, tile_size):
+                for left_edge in range(0, size, tile_size):
+                    right_edge = min(left_edge + tile_size, size)
+                    bottom_edge = min(top_edge + tile_size, size)
+                    if image is None:
+                        rows = slice(top_edge // block, -(-bottom_edge // block))
+                        cols = slice(left_edge // block, -(-right_edge // block))
+                        pixels = tiles.composite(indices[rows, cols], sheet)
+                        x, y = left_edge - cols.start*block, top_edge - rows.start*block
+                        output = Image.fromarray(pixels[y:y + bottom_edge - top_edge, x:x + right_edge - left_edge], "RGBA")
+                    else:
+                        output = image.crop((left_edge, top_edge, right_edge, bottom_edge))
+                    name = "%d_%d.%s" % (left_edge // tile_size, top_edge // tile_size, format)
+                    save_image(output, os.path.join(folder, name), compression)
+        with open(root + ".dzi", "w") as descriptor:
+            descriptor.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                             '<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" Format="%s" Overlap="0" TileSize="%d">\n'
+                             '  <Size Width="%d" Height="%d"/>\n'
+                             '</Image>\n' % (format, tile_size, width, width))
+    
+    def check_render(self, mode):
+        if mode not in self.images:
+            self.render([mode])
+        return self.images[mode]
+        
+    def scaled(self, mode):
+        # composited at the output size rather than resized from the native render
+        if self.scale == 1:
+            return self.check_render(mode)
+        self.prepare()
+        with profile.phase("render"):
+            tiles = get_atlas()
+            return tiles.render_scaled(self.tile_indices(tiles, self.applied_offset), mode, self.scale)
+        
+    def view_px(self):
+        self.scaled("pixel").show()
+        
+    def view_small(self):
+        self.scaled("small").show()
+        
+    def view_original(self):
+        self.scaled("original").show()
+        
+    def save(self, path, mode="original", compression=6):
+        save_image(self.scaled(mode), path, compression)
+        
+    def can_see(self, tiles, range):
+        labels, islands, field = self.visibility_field()
+        ring = field.ring(range)
+        tiles = np.asarray(tiles)
+        profile.count("ring probes", len(tiles))
+        return bool(ring[tiles[:, 1], tiles[:, 0]].any())
+        
+    def visibility_field(self):
+        # islands and user field of the fully visible board, kept until the next place
+        if self.field is None:
+            shown = self.shown
+            self.set_all_visible()
+            labels, islands = self.find_islands()
+            self.field = labels, islands, VisibilityField(self.user)
+            self.shown = shown
+        return self.field
+        
+    def island_visibility(self, radii):
+        labels, islands, field = self.visibility_field()
+        return field.island_sight(labels, len(islands), radii)
+        
+    def find_islands(self):
+        labels, count = label_torus(self.structs)
+        cells = island_cells(labels, count)
+        
+        # first gateway (row-major) within the 5x5 surround of each island
+        gy, gx = np.nonzero(self.gateways)
+        first = np.full(count + 1, len(gy))
+        for i, j in window(2):
+            near = labels[(gy + j) % self.size, (gx + i) % self.size]
+            np.minimum.at(first, near, np.arange(len(gy)))
+        
+        islands = []
+        for label in range(1, count + 1):
+            island = cells[label - 1]
+            gateway = None
+            if first[label] < len(gy):
+                gateway = (int(gx[first[label]]), int(gy[first[label]]))
+            islands.append(Island(label, island, gateway, self.bounds(island)))
+        return labels, islands
+        
+    def island_catalog(self):
+        # every island of the fully visible board, with its distance to the nearest user block
+        labels, islands, field = self.visibility_field()
+        if islands and islands[0].distance is None:
+            distance = field.nearest(labels > 0)
+            nearest = np.full(len(islands) + 1, np.iinfo(np.int32).max)
+            np.minimum.at(nearest, labels[labels > 0], distance[labels > 0])
+            for island in islands:
+                island.distance = int(nearest[island.label]) if nearest[island.label] >= 0 else None
+        return islands
+        
+    def find_island(self, x, y):
+        labels = self.visibility_field()[0]
+        label = labels[y % self.size, x % self.size]
+        return self.island_catalog()[label - 1] if label else None
+        
+    def islands_in(self, x, y, width, height):
+        # islands whose bounds meet the wrapped box
+        return [island for island in self.island_catalog() if island.overlaps(x, y, width, height, self.size)]
+
+    def mark_unseen(self, range):
+        labels, islands, field = self.visibility_field()
+        seen = field.island_sight(labels, len(islands), [range])[range]
+        self.apply_sight(labels, islands, seen)
+        self.marked = range
+        
+    def apply_sight(self, labels, islands, seen):
+        self.set_all_visible()
+        for island in islands:
+            if island.gateway and not seen[island.label]:
+                self.hide(*island.gateway)
+        seen[0] = True
+        self.shown &= seen[labels]
+        self.masks = None
+        
+    def update_tiles(self, tiles):
+        # Apply a newly parsed save in place. Returns the cells whose drawn
+        # tile may have changed, including neighbors whose borders follow them.
+        fresh = SPBoard(self.size)
+        tiles.fill(fresh)
+        changed = (fresh.types != self.types) | (fresh.offsets != self.offsets) | (fresh.modifiers != self.modifiers)
+        if not changed.any():
+            return changed
+        was_user = self.sort == SORT_USER
+        shown = self.shown.copy()
+        self.types[changed] = fresh.types[changed]
+        self.variants[changed] = fresh.variants[changed]
+        self.offsets[changed] = fresh.offsets[changed]
+        self.modifiers[changed] = fresh.modifiers[changed]
+        self.sort[changed] = fresh.sort[changed]
+        self.masks = None
+        self.field = None
+        if self.visible > 0:
+            user_changed = changed & (was_user | (self.sort == SORT_USER))
+            self.update_unseen(self.visible, changed, user_changed, shown)
+        else:
+            self.set_all_visible()
+        self.marked = self.visible if self.visible > 0 else -1
+        return with_neighbors(changed | (self.shown != shown))
+        
+    def update_unseen(self, range, changed, user_changed, shown):
+        # Only islands near a structural change, or with a changed user block
+        # on their ring, are evaluated again; the rest keep their old state.
+        touched = VisibilityField(changed).box(2) > 0
+        touched |= VisibilityField(user_changed).ring(range)
+        self.resight(range, touched, shown)
+        
+    def resight(self, range, touched, shown):
+        # islands with a touched cell are checked again, the rest stay as they were shown
+        labels, islands, field = self.visibility_field()
+        touched_labels = np.unique(labels[touched & (labels > 0)])
+        seen = np.zeros(len(islands) + 1, dtype=bool)
+        seen[np.unique(labels[shown & (labels > 0)])] = True
+        seen[touched_labels] = False
+        if len(touched_labels):
+            cells = np.isin(labels, touched_labels)
+            hits = np.bincount(labels[cells], weights=field.ring(range)[cells], minlength=len(islands) + 1)
+            seen[touched_labels] = hits[touched_labels] > 0
+        self.apply_sight(labels, islands, seen)
+            
+    def view(self, **options):
+        # A board over copies of these tiles, sharing their islands, to render
+        # with other options while this one stays as it is.
+        board = SPBoard(self.size, **options)
+        for name in ("types", "variants", "offsets", "modifiers", "sort", "shown"):
+            setattr(board, name, getattr(self, name).copy())
+        board.marked = self.marked
+        board.field = self.visibility_field()
+        return board
+        
+    def find_offset(self):
+        labels = self.visibility_field()[0] if self.offset_mode == "islands" else None
+        return find_offset(self.shown, self.offset_mode, labels)
+        
+    def dump_snapshot(self, path):
+        # the board as marked for its radius, with the islands found on it
+        self.prepare()
+        labels, islands, field = self.visibility_field()
+        table = np.full((len(islands), 6), -1, dtype=np.int32)
+        for row, island in zip(table, islands):
+            if island.gateway:
+                row[:2] = island.gateway
+            row[2:] = island.bounds
+        layout, total = snapshot_layout(self.size, len(islands))
+        buffer = bytearray(total)
+        snapshot_header.pack_into(buffer, 0, snapshot_magic, snapshot_version, self.size, self.marked, len(islands))
+        for name in snapshot_grids:
+            grid = getattr(self, name).astype(np.uint8)
+            buffer[layout[name]:layout[name] + grid.nbytes] = grid.tobytes()
+        buffer[layout["labels"]:layout["labels"] + labels.nbytes] = labels.astype("<i4").tobytes()
+        buffer[layout["islands"]:layout["islands"] + table.nbytes] = table.astype("<i4").tobytes()
+        write_atomic(path, lambda output: output.write(buffer))
+        
+    @staticmethod
+    def load_snapshot(path, scale=1, border=False, auto_offset=False, offset=(0, 0), visible=None, offset_mode="gaps"):
+        # Grids are copy-on-write views of the mapped file, so nothing is
+        # parsed, placed or marked again and later edits stay in memory.
+        with open(path, "rb") as file:
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+        magic, version, size, marked, count = snapshot_header.unpack_from(buffer, 0)
+        if magic != snapshot_magic or version != snapshot_version:
+            raise ValueError("%s is not a version %d board snapshot" % (path, snapshot_version))
+        layout, total = snapshot_layout(size, count)
+        if len(buffer) < total:
+            raise ValueError("%s is truncated" % path)
+        # shown as stored, marked again only for another radius
+        visible = marked if visible is None else visible
+        board = SPBoard(size, scale=scale, border=border, auto_offset=auto_offset, offset=offset, visible=visible, offset_mode=offset_mode)
+        for name in snapshot_grids:
+            grid = np.frombuffer(buffer, dtype=np.uint8, count=size * size, offset=layout[name]).reshape(size, size)
+            setattr(board, name, grid.view(bool) if name == "shown" else grid)
+        board.sort = sort_table[board.types]
+        board.marked = marked
+        labels = np.frombuffer(buffer, dtype="<i4", count=size * size, offset=layout["labels"]).reshape(size, size)
+        table = np.frombuffer(buffer, dtype="<i4", count=count * 6, offset=layout["islands"]).reshape(count, 6)
+        islands = []
+        for label, (cells, row) in enumerate(zip(island_cells(labels, count), table.tolist()), 1):
+            gateway = tuple(row[:2]) if row[0] >= 0 else None
+            islands.append(Island(label, cells, gateway, tuple(row[2:])))
+        board.field = labels, islands, VisibilityField(board.sort == SORT_USER)
+        return board
+
+## Render Cache
+
+# seconds after which a cache temporary file is taken as left by a crashed writer
+stale_temp = 3600
+
+class RenderCache():
+    # Finished renders and visibility results on disk, keyed by the save bytes,
+    # the options that change the picture and the tileset. Renders are kept at
+    # offset (0, 0) and unscaled, so offset and scale changes still hit.
+    def __init__(self, folder, limit):
+        self.folder = folder
+        self.limit = limit
+        os.makedirs(folder, exist_ok=True)
+        
+    def key(self, *parts):
+        return hashlib.sha256(repr((tileset_hash(),) + parts).encode()).hexdigest()[:32]
+        
+    def path(self, key, ext):
+        return os.path.join(self.folder, key + ext)
+        
+    def touch(self, path):
+        # mtime doubles as the last use time for eviction
+        os.utime(path)
+        
+    def discard(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+            
+    def get_image(self, key):
+        path = self.path(key, ".png")
+        try:
+            image = Image.open(path)
+            image.load()
+        except OSError:
+            self.discard(path)
+            return None
+        self.touch(path)
+        return image
+        
+    def get_state(self, key):
+        path = self.path(key, ".npz")
+        try:
+            with np.load(path) as data:
+                state = dict(data)
+        except npz_errors:
+            # a missing entry is a miss, a damaged one is dropped as well
+            self.discard(path)
+            return None
+        self.touch(path)
+        return state
+        
+    def put_image(self, key, image):
+        self.write(self.path(key, ".png"), lambda output: image.save(output, "PNG", compress_level=1))
+        
+    def put_state(self, key, **arrays):
+        self.write(self.path(key, ".npz"), lambda output: np.savez_compressed(output, **arrays))
+        
+    def write(self, path, writer):
+        write_atomic(path, writer)
+        self.evict()
+        
+    def evict(self):
+        # Least recently used entries go first once the folder is over its
+        # limit. Temporary files are left to their writers unless they are
+        # old enough that the writer must have died.
+        entries = []
+        for name in os.listdir(self.folder):
+            try:
+                stat = os.stat(os.path.join(self.folder, name))
+            except OSError:
+                continue
+            if name.endswith(".tmp"):
+                if time.time() - stat.st_mtime > stale_temp:
+                    self.discard(os.path.join(self.folder, name))
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, name))
+        total = sum(size for mtime, size, name in entries)
+        for mtime, size, name in sorted(entries):
+            if total <= self.limit:
+                break
+            try:
+                os.remove(os.path.join(self.folder, name))
+            except OSError:
+                continue
+            total -= size
+
+def cached_render(cache, file, args):
+    # yields (radius, image) for every swept radius, parsing only on a miss
+    with open(file, "rb") as save:
+        save_hash = hashlib.sha256(save.read()).hexdigest()
+    mode = output_mode(args)
+    board = None
+    radii = [-1] if args.visible else args.radius
+    for radius in radii:
+        state_key = cache.key(save_hash, radius)
+        image_key = cache.key(save_hash, radius, mode, args.border)
+        state = cache.get_state(state_key)
+        image = cache.get_image(image_key)
+        if state is None or image is None:
+            if board is None:
+                board = load_board(file, args)
+            board.visible = radius
+            board.set_offset(0, 0)
+            board.invalidate()
+            image = board.check_render(mode)
+            state = dict(shown=board.shown, labels=board.visibility_field()[0])
+            cache.put_state(state_key, **state)
+            cache.put_image(image_key, image)
+        if args.auto:
+            offset = find_offset(state["shown"], args.auto, state["labels"])
+        else:
+            offset = args.offset
+        scale = tile_sizes[mode]
+        image = ImageChops.offset(image, offset[0]*scale, offset[1]*scale)
+        yield radius, scale_image(image, args.scale)
+
+## Main Entrypoint
+
+def board_options(args):
+    # SPBoard keywords for the command line's render options
+    if args.auto:
+        auto_offset = True
+        offset = (0, 0)
+    else:
+        auto_offset = False
+        offset = args.offset
+    if args.visible:
+        visible = -1
+    else:
+        visible = args.radius[0]
+    return dict(scale=args.scale, border=args.border, auto_offset=auto_offset, offset=offset, visible=visible, offset_mode=args.auto or "gaps")
+
+def load_board(file, args):
+    size = 160
+    options = board_options(args)
+    if is_snapshot(file):
+        # marked again only if the radius differs, from the stored islands
+        with profile.phase("read"):
+            return SPBoard.load_snapshot(file, **options)
+    board = SPBoard(size, **options)
+    with profile.phase("read"):
+        buffer = starsave.read(file)
+    with profile.phase("parse"):
+        save = starsave.parse(buffer)
+    with profile.phase("place"):
+        save.tiles.fill(board)
+    return board
+    
+def output_mode(args):
+    if args.pixel:
+        return "pixel"
+    elif args.tile:
+        return "small"
+    else:
+        return "original"
+        
+def board_renders(board, args):
+    # every swept radius reuses the board's islands and visibility field
+    mode = output_mode(args)
+    radii = [board.visible] if args.visible else args.radius
+    for radius in radii:
+        board.set_radius(radius)
+        yield radius, board.scaled(mode)
+        
+def render_save(file, args, output=None):
+    if args.cache:
+        renders = cached_render(RenderCache(os.path.join(cache_dir(), "renders"), args.cache_size << 20), file, args)
+    else:
+        renders = board_renders(load_board(file, args), args)
+    sweep = not args.visible and len(args.radius) > 1
+    # each finished image is encoded while the next one is composited
+    saves = []
+    for radius, image in renders:
+        if output:
+            path = output
+            if sweep:
+                root, ext = os.path.splitext(path)
+                path = "%s_r%d%s" % (root, radius, ext)
+            if render_threads > 1:
+                saves.append(get_pool().submit(save_image, image, path, args.compress))
+            else:
+                save_image(image, path, args.compress)
+        else:
+            image.show()
+    for save in saves:
+        save.result()
+            
+## Batch Rendering
+
+def batch_files(source):
+    if os.path.isdir(source):
+        return sorted(glob.glob(os.path.join(source, "*.save")))
+    return sorted(glob.glob(source))
+    
+def batch_init(threads):
+    # each worker loads the tile atlas once, before its first save
+    set_threads(threads)
+    get_atlas()
+    
+def batch_job(job):
+    # returns (file, seconds, error, profile stats); each job is profiled on its own
+    file, output, args = job
+    if args.profile:
+        profile.reset()
+        profile.enable()
+    start = time.perf_counter()
+    try:
+        render_save(file, args, output)
+    except Exception as error:
+        return file, time.perf_counter() - start, "%s: %s" % (type(error).__name__, error), None
+    return file, time.perf_counter() - start, None, profile.as_dict() if args.profile else None
+    
+def batch_outputs(files, folder, format):
+    # each save's path under the saves' common folder is mirrored in the output folder
+    if not files:
+        return []
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(file)) for file in files])
+    outputs = []
+    for file in files:
+        name = os.path.relpath(os.path.splitext(os.path.abspath(file))[0], root)
+        outputs.append(os.path.join(folder, "%s.%s" % (name, format)))
+    return outputs
+    
+def render_batch(args):
+    files = batch_files(args.batch)
+    outputs = batch_outputs(files, args.output or ".", args.format)
+    written = dict()
+    for file, output in zip(files, outputs):
+        if output in written:
+            get_parser().error("%s and %s would both be rendered to %s" % (written[output], file, output))
+        written[output] = file
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    jobs = [(file, output, args) for file, output in zip(files, outputs)]
+    
+    failed = 0
+    start = time.perf_counter()
+    # the processes already share the cores, so workers draw on one thread unless told otherwise
+    threads = args.threads or 1
+    # imported here, as the server's modules are, to keep importing starspawn cheap
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=args.jobs, initializer=batch_init, initargs=(threads,)) as pool:
+        for file, elapsed, error, stats in pool.map(batch_job, jobs):
+            if stats:
+                profile.merge(stats)
+            if error:
+                failed += 1
+                print("%s: failed after %.2fs (%s)" % (file, elapsed, error))
+            else:
+                print("%s: %.2fs" % (file, elapsed))
+    print("%d rendered, %d failed in %.2fs" % (len(jobs) - failed, failed, time.perf_counter() - start))
+    return 1 if failed else 0
+
+## Watch Mode
+
+def read_settled(path):
+    # Plain bytes rather than a mapping, so a save truncated while it is read
+    # cannot fault and nothing holds it open between polls. None while the
+    # game is part way through rewriting it.
+    with open(path, "rb") as save:
+        size = os.fstat(save.fileno()).st_size
+        buffer = save.read()
+    if not buffer or len(buffer) != size:
+        return None
+    return buffer
+    
+def watch(board, args):
+    # follow the save as the game rewrites it, repainting only changed cells
+    mode = output_mode(args)
+    # a scaled output is kept and patched at its own tile size, outside the board's renders
+    size = round(tile_sizes[mode] * board.scale)
+    image = board.scaled(mode)
+    save_image(image, args.output, args.compress)
+    seen = None
+    while True:
+        try:
+            stat = os.stat(args.file)
+        except OSError:
+            stat = None
+        if stat and (stat.st_mtime_ns, stat.st_size) != seen:
+            if seen is not None:
+                start = time.perf_counter()
+                try:
+                    buffer = read_settled(args.file)
+                    tiles = starsave.parse(buffer).tiles if buffer else None
+                except (OSError, ValueError):
+                    tiles = None
+                if tiles is None:
+                    # caught mid-write; try again on the next poll
+                    time.sleep(args.interval)
+                    continue
+                dirty = board.update_tiles(tiles)
+                if board.scale == 1:
+                    board.redraw(dirty)
+                else:
+                    board.draw_cells(image, dirty, mode, size)
+                if board.auto_offset:
+                    xoffset, yoffset = board.find_offset()
+                    xoffset, yoffset = xoffset - board.applied_offset[0], yoffset - board.applied_offset[1]
+                    board.shift(xoffset, yoffset)
+                    if board.scale != 1:
+                        image = ImageChops.offset(image, xoffset*size, yoffset*size)
+                if board.scale == 1:
+                    image = board.images[mode]
+                save_image(image, args.output, args.compress)
+                print("%d cells redrawn in %.2fs" % (dirty.sum(), time.perf_counter() - start))
+            seen = (stat.st_mtime_ns, stat.st_size)
+        time.sleep(args.interval)
+
+## Render Server
+#
+# GET or POST /render with options as query parameters named like the
+# flags (radius=5&offset=3,4&border=1&mode=pixel&format=webp). The save is
+# the file=PATH parameter or the POST body. Images are encoded in full
+# before replying, so a failed render still gets an error status.
+
+value_flags = ("file", "radius", "offset", "scale", "region", "block-size", "format", "compress")
+switch_flags = ("border", "visible")
+render_mode_flags = {"pixel": ["--pixel"], "small": ["--tile"], "original": []}
+
+def request_args(query):
+    # only rendering options are accepted, never output paths or other modes
+    argv = []
+    for key, values in parse_qs(query, keep_blank_values=True).items():
+        key = key.replace("_", "-")
+        for value in values:
+            if key in value_flags:
+                argv += ["--" + key] + value.split(",")
+            elif key in switch_flags and value.lower() in ("", "1", "true", "yes"):
+                argv.append("--" + key)
+            elif key == "auto":
+                argv += ["--auto"] + ([value] if value else [])
+            elif key == "mode" and value in render_mode_flags:
+                argv += render_mode_flags[value]
+            else:
+                raise ValueError("unknown option %s=%s" % (key, value))
+    try:
+        args = get_parser().parse_args(argv)
+        check_args(args)
+        return args
+    except SystemExit:
+        raise ValueError("invalid options %s" % " ".join(argv))
+
+class BoardStore():
+    # parsed boards and their islands kept between requests, least recently used dropped first
+    def __init__(self, limit):
+        self.limit = limit
+        self.boards = OrderedDict()
+        self.lock = threading.Lock()
+        
+    def get(self, key, load):
+        with self.lock:
+            if key in self.boards:
+                self.boards.move_to_end(key)
+                return self.boards[key]
+        board = load()
+        board.visibility_field()
+        with self.lock:
+            self.boards[key] = board
+            while len(self.boards) > self.limit:
+                self.boards.popitem(last=False)
+        return board
+
+def parsed_board(save):
+    unknown = np.setdiff1d(save.tiles.types, list(Block.all_blocks))
+    if len(unknown):
+        raise ValueError("unknown tile types %s" % ", ".join(map(str, unknown.tolist())))
+    board = SPBoard(160)
+    save.tiles.fill(board)
+    return board
+
+def serve_render(store, args, body):
+    if body:
+        key = hashlib.sha256(body).hexdigest()
+        board = store.get(key, lambda: parsed_board(starsave.parse(body)))
+    else:
+        path = os.path.abspath(args.file)
+        stat = os.stat(path)
+        # a rewritten save has a new key, and its old board ages out
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        board = store.get(key, lambda: SPBoard.load_snapshot(path) if is_snapshot(path) else parsed_board(starsave.load(path)))
+    board = board.view(**board_options(args))
+    if args.region:
+        return board.render_region(*args.region, output_mode(args), args.block_size)
+    return board.scaled(output_mode(args))
+
+def answer_render(handler, body):
+    # the body of RenderHandler's GET and POST
+    url = urlsplit(handler.path)
+    if url.path != "/render":
+        return handler.send_error(404)
+    try:
+        args = request_args(url.query)
+        image = serve_render(handler.server.store, args, body)
+        output = io.BytesIO()
+        save_image(image, output, args.compress, args.format)
+    except FileNotFoundError as error:
+        return handler.send_error(404, str(error))
+    except (OSError, ValueError) as error:
+        return handler.send_error(400, str(error))
+    except Exception as error:
+        return handler.send_error(500, "%s: %s" % (type(error).__name__, error))
+    handler.send_response(200)
+    handler.send_header("Content-Type", "image/" + args.format)
+    handler.send_header("Content-Length", str(len(output.getbuffer())))
+    handler.end_headers()
+    handler.wfile.write(output.getbuffer())
+
+class PooledMixIn():
+    # Requests are handled on a fixed set of worker threads. The accept loop
+    # waits for a free worker, so further clients queue in the listen
+    # backlog instead of each getting a thread.
+    def process_request(self, request, client_address):
+        self.slots.acquire()
+        self.pool.submit(self.process_pooled, request, client_address)
+        
+    def process_pooled(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.slots.release()
+    
+def loopback(host):
+    # every address the host resolves to must stay on this machine
+    import ipaddress, socket
+    try:
+        addresses = socket.getaddrinfo(host, None, socket.AF_INET)
+    except OSError:
+        return False
+    return bool(host) and all(ipaddress.ip_address(address[4][0]).is_loopback for address in addresses)
+
+def serve(args):
+    # a numeric address is a localhost port, HOST:PORT a TCP address, anything else a Unix socket
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import UnixStreamServer
+    
+    class RenderHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            answer_render(self, b"")
+            
+        def do_POST(self):
+            answer_render(self, self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+            
+        def address_string(self):
+            # Unix socket clients have no address
+            return self.client_address[0] if self.client_address else "local"
+            
+    class RenderServer(PooledMixIn, HTTPServer):
+        pass
+        
+    class UnixRenderServer(PooledMixIn, UnixStreamServer):
+        pass
+        
+    address = args.serve
+    host, _, port = address.rpartition(":")
+    if address.isdigit():
+        server = RenderServer(("127.0.0.1", int(address)), RenderHandler)
+    elif port.isdigit():
+        # requests can name any file the server can read, so they never come from other machines
+        if not loopback(host):
+            get_parser().error("--serve %s is not a loopback address" % host)
+        server = RenderServer((host, int(port)), RenderHandler)
+    else:
+        # only a socket left behind by an earlier server is replaced
+        try:
+            if not S_ISSOCK(os.stat(address).st_mode):
+                get_parser().error("--serve %s exists and is not a socket" % address)
+            os.remove(address)
+        except FileNotFoundError:
+            pass
+        server = UnixRenderServer(address, RenderHandler)
+    workers = args.jobs or os.cpu_count() or 1
+    server.store = BoardStore(args.boards)
+    server.slots = threading.BoundedSemaphore(workers)
+    server.pool = ThreadPoolExecutor(max_workers=workers)
+    get_atlas()
+    print("serving on %s" % address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.pool.shutdown(wait=False, cancel_futures=True)
+        if isinstance(server, UnixRenderServer):
+            os.remove(address)
+
+def check_args(args):
+    # what argparse cannot check by itself, reported the same way
+    parser = get_parser()
+    if args.scale <= 0:
+        parser.error("--scale must be positive")
+    if args.region and (args.region[2] <= 0 or args.region[3] <= 0):
+        parser.error("--region width and height must be positive")
+    if args.block_size is not None and args.block_size <= 0:
+        parser.error("--block-size must be positive")
+    if args.watch and not args.output:
+        parser.error("--watch needs --output")
+    size = tile_sizes[output_mode(args)] * args.scale
+    if args.watch and abs(size - round(size)) > 1e-6:
+        parser.error("--watch needs a --scale that gives whole pixel tiles")
+    if args.output and not args.batch and os.path.splitext(args.output)[1].lower().lstrip(".") not in output_formats:
+        parser.error("--output must end in .png or .webp")
+        
+def main():    
+    args = get_parser().parse_args()
+    check_args(args)
+    if args.threads is not None:
+        set_threads(args.threads)
+    if not args.profile:
+        return dispatch(args)
+    profile.enable()
+    try:
+        return dispatch(args)
+    finally:
+        print(profile.report(args.profile), file=sys.stderr)
+        
+def dispatch(args):
+    global board # Debugging global
+    if args.serve:
+        return serve(args)
+    if args.batch:
+        return render_batch(args)
+    if args.watch:
+        board = load_board(args.file, args)
+        return watch(board, args)
+    if args.snapshot:
+        board = load_board(args.file, args)
+        return board.dump_snapshot(args.snapshot)
+    if args.pyramid:
+        board = load_board(args.file, args)
+        return board.export_pyramid(args.pyramid, args.tile_size, args.format, args.compress)
+    if args.region:
+        board = load_board(args.file, args)
+        image = board.render_region(*args.region, output_mode(args), args.block_size)
+        if args.output:
+            return save_image(image, args.output, args.compress)
+        return image.show()
+    render_save(args.file, args, args.output)
+
+if __name__ == "__main__":
+    board = None
+    sys.exit(main())